@@ -8,15 +8,20 @@ import warnings
 from collections import defaultdict
 
 import numpy as np
-import numpy.lib.recfunctions as rfn
 
-import cupy as cp
-from cupy.cuda.nvtx import RangePush, RangePop
+try:
+    import cupy as cp
+    from cupy.cuda.nvtx import RangePush, RangePop
+except ImportError as err:
+    raise ImportError("larnd-sim requires cupy, which is not installed by default: "
+                      "install it from the larnd-sim directory with 'pip install .[gpu-cu12]' "
+                      "(or 'pip install .[gpu-cu11]' for CUDA 11)") from err
 
 import fire
 import h5py
 
-from numba.cuda import device_array, to_device
+from numba.cuda import device_array, pinned_array, to_device, external_stream
+from numba.cuda import stream as cuda_stream, event as cuda_event
 from numba.cuda.random import create_xoroshiro128p_states
 from numba.core.errors import NumbaPerformanceWarning
 
@@ -44,26 +49,26 @@ def swap_coordinates(tracks):
     Swap x and z coordinates in tracks.
     This is because the convention in larnd-sim is different
     from the convention in edep-sim. FIXME.
+    The fields are swapped by renaming them in a view of the array,
+    so no data is copied.
 
     Args:
         tracks (:obj:`numpy.ndarray`): tracks array.
 
     Returns:
-        :obj:`numpy.ndarray`: tracks with swapped axes.
+        :obj:`numpy.ndarray`: view of the tracks with swapped axes.
     """
-    x_start = np.copy(tracks['x_start'] )
-    x_end = np.copy(tracks['x_end'])
-    x = np.copy(tracks['x'])
-
-    tracks['x_start'] = np.copy(tracks['z_start'])
-    tracks['x_end'] = np.copy(tracks['z_end'])
-    tracks['x'] = np.copy(tracks['z'])
-
-    tracks['z_start'] = x_start
-    tracks['z_end'] = x_end
-    tracks['z'] = x
-
-    return tracks
+    swapped = {'x_start': 'z_start', 'z_start': 'x_start',
+               'x_end': 'z_end', 'z_end': 'x_end',
+               'x': 'z', 'z': 'x'}
+    dtype = tracks.dtype
+    swapped_dtype = np.dtype({'names': [swapped.get(name, name) for name in dtype.names],
+                              'formats': [dtype.fields[name][0] for name in dtype.names],
+                              'offsets': [dtype.fields[name][1] for name in dtype.names],
+                              'itemsize': dtype.itemsize},
+                             align=dtype.isalignedstruct)
+
+    return tracks.view(swapped_dtype)
 
 def maybe_create_rng_states(n, seed=0, rng_states=None):
     """Create or extend random states for CUDA kernel"""
@@ -72,6 +77,8 @@ def maybe_create_rng_states(n, seed=0, rng_states=None):
         return create_xoroshiro128p_states(n, seed=seed)
 
     if n > len(rng_states):
+        # grow geometrically, so that the states are extended only a few times
+        n = max(n, 2 * len(rng_states))
         new_states = device_array(n, dtype=rng_states.dtype)
         new_states[:len(rng_states)] = rng_states
         new_states[len(rng_states):] = create_xoroshiro128p_states(n - len(rng_states), seed=seed)
@@ -79,6 +86,86 @@ def maybe_create_rng_states(n, seed=0, rng_states=None):
 
     return rng_states
 
+def stage_to_device(array, stream, staging=None):
+    """
+    Copy an array to the device through a page-locked staging buffer,
+    so that the transfer can be queued asynchronously on `stream`.
+
+    Args:
+        array (:obj:`numpy.ndarray`): host array to be copied.
+        stream (:obj:`numba.cuda.cudadrv.driver.Stream`): stream used for the copy.
+        staging (tuple, optional): pinned and device buffers and copy event returned by a
+            previous call. The buffers are reused if they are large enough, otherwise new
+            ones are allocated. Before overwriting the pinned buffer, the host waits for
+            the previous copy out of it to be completed.
+
+    Returns:
+        tuple: device array and staging buffers to be passed to the next call. The last
+        element of the staging buffers is the event recorded at the end of the copy.
+    """
+    if staging is not None:
+        # the previous copy may still be reading the pinned buffer
+        staging[2].synchronize()
+
+    if staging is None or staging[0].dtype != array.dtype or staging[0].shape[0] < array.shape[0]:
+        staging = (pinned_array(array.shape, dtype=array.dtype),
+                   device_array(array.shape, dtype=array.dtype))
+
+    host_array = staging[0][:array.shape[0]]
+    host_array[...] = array
+    d_array = staging[1][:array.shape[0]]
+    d_array.copy_to_device(host_array, stream=stream)
+    copy_done = cuda_event()
+    copy_done.record(stream)
+    return d_array, (staging[0], staging[1], copy_done)
+
+def prefetch_batches(tracks, batcher, streams, compute_stream):
+    """
+    Iterate over the batches of track segments, copying the tracks of
+    the next batch to the device while the current one is being simulated.
+    The copies alternate between `streams`, each with its own staging buffers.
+    The host writes a batch into a staging buffer only after the previous
+    copy out of it is completed, and the copy waits for the kernels that may
+    still read the device buffer.
+
+    Args:
+        tracks (:obj:`numpy.ndarray`): tracks array.
+        batcher (:obj:`larndsim.util.batching.TrackSegmentBatcher`): iterator
+            returning the mask of the tracks in each batch.
+        streams (list): streams used for the copies. They should not
+            synchronize with the stream running the simulation kernels.
+        compute_stream (:obj:`numba.cuda.cudadrv.driver.Stream`): stream running
+            the simulation kernels. A copy waits for the kernels already queued
+            on it before overwriting their staging buffers.
+
+    Yields:
+        tuple: batch mask, host and device tracks of the batch and the event
+        recorded at the end of the copy (`None` for empty batches)
+    """
+    staging = [None] * len(streams)
+    pending = None
+
+    for ibatch, batch_mask in enumerate(batcher):
+        track_subset = tracks[batch_mask]
+        d_track_subset, copy_done = None, None
+
+        if len(track_subset) > 0:
+            i_stream = ibatch % len(streams)
+            buffer_released = cuda_event()
+            buffer_released.record(compute_stream)
+            buffer_released.wait(streams[i_stream])
+            # stage_to_device waits for the copy-done event of this slot
+            # before writing the batch into its pinned buffer
+            d_track_subset, staging[i_stream] = stage_to_device(track_subset, streams[i_stream], staging[i_stream])
+            copy_done = staging[i_stream][2]
+
+        if pending is not None:
+            yield pending
+        pending = (batch_mask, track_subset, d_track_subset, copy_done)
+
+    if pending is not None:
+        yield pending
+
 def run_simulation(input_filename,
                    pixel_layout,
                    detector_properties,
@@ -168,7 +255,8 @@ def run_simulation(input_filename,
     start_load = time()
     # First of all we load the edep-sim output
     with h5py.File(input_filename, 'r') as f:
-        tracks = np.array(f['segments'])
+        # Only the segments to be simulated are read from the file
+        tracks = f['segments'][:n_tracks] if n_tracks else f['segments'][()]
         if 'segment_id' in tracks.dtype.names:
             segment_ids = tracks['segment_id']
         else:
@@ -180,32 +268,17 @@ def run_simulation(input_filename,
                 new_tracks[field[0]] = tracks[field[0]]
             tracks = new_tracks
             segment_ids = tracks['segment_id']
-        try:
-            trajectories = np.array(f['trajectories'])
-            input_has_trajectories = True
-        except KeyError:
-            input_has_trajectories = False
-
-        try:
-            vertices = np.array(f['vertices'])
-            input_has_vertices = True
-        except KeyError:
-            print("Input file does not have true vertices info")
-            input_has_vertices = False
 
-        try:
-            genie_hdr = np.array(f['genie_hdr'])
-            input_has_genie_hdr = True
-        except KeyError:
+        # The truth datasets are not needed by the simulation, so they are
+        # copied directly from the input to the output file later on
+        truth_datasets = [name for name in ('trajectories', 'vertices', 'genie_hdr', 'genie_stack')
+                          if name in f]
+        if 'vertices' not in f:
+            print("Input file does not have true vertices info")
+        if 'genie_hdr' not in f:
             print("Input file does not have GENIE event summary info")
-            input_has_genie_hdr = False
-
-        try:
-            genie_stack = np.array(f['genie_stack'])
-            input_has_genie_stack = True
-        except KeyError:
+        if 'genie_stack' not in f:
             print("Input file does not have GENIE particle stack info")
-            input_has_genie_stack = False
 
     if tracks.size == 0:
         print("Empty input dataset, exiting")
@@ -215,16 +288,10 @@ def run_simulation(input_filename,
     end_load = time()
     print(f" {end_load-start_load:.2f} s")
 
-    response = cp.load(response_file)
-
-    TPB = 256
-    BPG = max(ceil(tracks.shape[0] / TPB),1)
+    # the signals are computed in single precision, so the tabulated response is stored as such
+    response = cp.load(response_file).astype(np.float32, copy=False)
 
     print("******************\nRUNNING SIMULATION\n******************")
-    # Reduce dataset if not all tracks to be simulated
-    if n_tracks:
-        tracks = tracks[:n_tracks]
-
     # Here we swap the x and z coordinates of the tracks
     # because of the different convention in larnd-sim wrt edep-sim
     tracks = swap_coordinates(tracks)
@@ -245,24 +312,34 @@ def run_simulation(input_filename,
         light_sim_dat['segment_id'] = segment_ids[..., np.newaxis]
         track_light_voxel = np.zeros([len(tracks), 3], dtype='i4')
 
-    if 'n_photons' not in tracks.dtype.names:
-        n_photons = np.zeros(tracks.shape[0], dtype=[('n_photons', 'f4')])
-        tracks = rfn.merge_arrays((tracks, n_photons), flatten=True)
-
-    if 't0' not in tracks.dtype.names:
+    # the fields missing in the input are added with a single allocation
+    new_fields = []
+    add_n_photons = 'n_photons' not in tracks.dtype.names
+    if add_n_photons:
+        new_fields.append(('n_photons', 'f4'))
+    add_t0 = 't0' not in tracks.dtype.names
+    if add_t0:
+        new_fields += [('t0', 'f4'), ('t0_start', 'f4'), ('t0_end', 'f4')]
+
+    if new_fields:
+        new_tracks = np.empty(tracks.shape,
+                              dtype=[(name, tracks.dtype.fields[name][0]) for name in tracks.dtype.names] + new_fields)
+        for name in tracks.dtype.names:
+            new_tracks[name] = tracks[name]
+        tracks = new_tracks
+
+    if add_n_photons:
+        tracks['n_photons'] = 0
+
+    if add_t0:
         # the t0 key refers to the time of energy deposition
         # in the input files, it is called 't'
         # this is only true for older edep inputs (which are included in `examples/`)
-        t0 = np.array(tracks['t'].copy(), dtype=[('t0', 'f4')])
-        t0_start = np.array(tracks['t_start'].copy(), dtype=[('t0_start', 'f4')])
-        t0_end = np.array(tracks['t_end'].copy(), dtype=[('t0_end', 'f4')])
-        tracks = rfn.merge_arrays((tracks, t0, t0_start, t0_end), flatten=True)
-
         # then, re-initialize the t key to zero
         # in larnd-sim, this key is the time at the anode
-        tracks['t'] = np.zeros(tracks.shape[0], dtype=[('t', 'f4')])
-        tracks['t_start'] = np.zeros(tracks.shape[0], dtype=[('t_start', 'f4')])
-        tracks['t_end'] = np.zeros(tracks.shape[0], dtype=[('t_end', 'f4')])
+        for suffix in ('', '_start', '_end'):
+            tracks['t0' + suffix] = tracks['t' + suffix]
+            tracks['t' + suffix] = 0
 
     if sim.IS_SPILL_SIM:
         # "Reset" the spill period so t0 is wrt the corresponding spill start time.
@@ -274,38 +351,60 @@ def run_simulation(input_filename,
         tracks['t0_end'] = tracks['t0_end'] - localSpillIDs*sim.SPILL_PERIOD
         tracks['t0'] = tracks['t0'] - localSpillIDs*sim.SPILL_PERIOD
 
+    # All the kernels are queued on this stream. It is a blocking stream, so it
+    # stays ordered with respect to the CuPy operations on the default stream.
+    stream = cuda_stream()
+
     # We calculate the number of electrons after recombination (quenching module)
     # and the position and number of electrons after drifting (drifting module)
-    print("Quenching electrons..." , end="")
-    start_quenching = time()
-    quenching.quench[BPG,TPB](tracks, physics.BIRKS)
-    end_quenching = time()
-    print(f" {end_quenching-start_quenching:.2f} s")
-
-    print("Drifting electrons...", end="")
-    start_drifting = time()
-    drifting.drift[BPG,TPB](tracks)
-    end_drifting = time()
-    print(f" {end_drifting-start_drifting:.2f} s")
+    # The kernels are timed with events on the stream, so that they can be
+    # queued back-to-back without synchronizing the host in between
+    start_quenching, end_quenching, end_drifting = cuda_event(), cuda_event(), cuda_event()
+    # The tracks are kept in page-locked memory from here on, so that the
+    # copies to and from the device are truly asynchronous
+    pinned_tracks = pinned_array(tracks.shape, dtype=tracks.dtype)
+    pinned_tracks[:] = tracks
+    tracks = pinned_tracks
+    d_tracks = to_device(tracks, stream=stream)
+    start_quenching.record(stream)
+    # 1D kernels are launched with the block size that maximizes occupancy
+    quenching.quench.forall(tracks.shape[0], stream=stream)(d_tracks, physics.BIRKS)
+    end_quenching.record(stream)
+    drifting.drift.forall(tracks.shape[0], stream=stream)(d_tracks)
+    end_drifting.record(stream)
+    d_tracks.copy_to_host(tracks, stream=stream)
+    stream.synchronize()
+    print(f"Quenching electrons... {start_quenching.elapsed_time(end_quenching)/1000:.2f} s")
+    print(f"Drifting electrons... {end_quenching.elapsed_time(end_drifting)/1000:.2f} s")
 
     if light.LIGHT_SIMULATED:
         print("Calculating optical responses...", end="")
         start_light_time = time()
         lut = np.load(light_lut_filename)['arr']
+        # the LUT is used in single precision on the device, whatever the precision of the file
+        lut = lut.astype([(name, np.float32, lut.dtype[name].shape) for name in lut.dtype.names], copy=False)
 
         # clip LUT so that no voxel contains 0 visibility
         mask = lut['vis'] > 0
         lut['vis'][~mask] = lut['vis'][mask].min()
 
-        lut = to_device(lut)
+        lut = to_device(lut, stream=stream)
 
         light_noise = cp.load(light_det_noise_filename)
 
-        TPB = 256
-        BPG = max(ceil(tracks.shape[0] / TPB),1)
-        lightLUT.calculate_light_incidence[BPG,TPB](tracks, lut, light_sim_dat, track_light_voxel)
+        # the drifted tracks are still on the device
+        d_light_sim_dat = to_device(light_sim_dat, stream=stream)
+        d_track_light_voxel = to_device(track_light_voxel, stream=stream)
+        lightLUT.calculate_light_incidence.forall(tracks.shape[0], stream=stream)(
+            d_tracks, lut, d_light_sim_dat, d_track_light_voxel)
+        d_light_sim_dat.copy_to_host(light_sim_dat, stream=stream)
+        d_track_light_voxel.copy_to_host(track_light_voxel, stream=stream)
+        stream.synchronize()
         print(f" {time()-start_light_time:.2f} s")
 
+    # the tracks of each batch are copied again in the simulation loop
+    del d_tracks
+
     if sim.IS_SPILL_SIM:
         # write the true timing structure to the file, not t0 wrt event time .....
         tracks['t0_start'] = tracks['t0_start'] + localSpillIDs*sim.SPILL_PERIOD
@@ -316,23 +415,20 @@ def run_simulation(input_filename,
     with h5py.File(output_filename, 'a') as output_file:
         # We previously called swap_coordinates(tracks), but we want to write
         # all truth info in the edep-sim convention (z = beam coordinate). So
-        # temporarily undo the swap. It's easier than reorganizing the code!
-        swap_coordinates(tracks)
-        output_file.create_dataset("tracks", data=tracks)
+        # write a view with the swap undone.
+        # The truth datasets are chunked and compressed with LZF, which is fast
+        # enough not to slow down the writing
+        output_file.create_dataset("tracks", data=swap_coordinates(tracks),
+                                   compression='lzf', shuffle=True)
         # To distinguish from the "old" files that had z=drift in 'tracks':
         output_file['tracks'].attrs['zbeam'] = True
-        swap_coordinates(tracks)
 
         if light.LIGHT_SIMULATED:
-            output_file.create_dataset('light_dat', data=light_sim_dat)
-        if input_has_trajectories:
-            output_file.create_dataset("trajectories", data=trajectories)
-        if input_has_vertices:
-            output_file.create_dataset("vertices", data=vertices)
-        if input_has_genie_hdr:
-            output_file.create_dataset("genie_hdr", data=genie_hdr)
-        if input_has_genie_stack:
-            output_file.create_dataset("genie_stack", data=genie_stack)
+            output_file.create_dataset('light_dat', data=light_sim_dat,
+                                       compression='lzf', shuffle=True)
+        with h5py.File(input_filename, 'r') as f:
+            for name in truth_datasets:
+                f.copy(f[name], output_file, name)
 
     if sim.IS_SPILL_SIM:
         # ..... even thought larnd-sim does expect t0 to be given with respect to
@@ -347,8 +443,10 @@ def run_simulation(input_filename,
     # copy to device
     track_ids = cp.asarray(np.arange(segment_ids.shape[0], dtype=int))
 
+    batcher = batching.TPCBatcher(tracks, sim.EVENT_SEPARATOR, tpc_batch_size=sim.EVENT_BATCH_SIZE, tpc_borders=detector.TPC_BORDERS)
+
     # create a lookup table for event timestamps
-    tot_evids = np.unique(tracks[sim.EVENT_SEPARATOR])
+    tot_evids = batcher.events
     if sim.IS_SPILL_SIM:
         event_times = cp.arange(len(tot_evids)) * sim.SPILL_PERIOD
     else:
@@ -357,6 +455,12 @@ def run_simulation(input_filename,
     # We divide the sample in portions that can be processed by the GPU
     step = 1
 
+    # lookup table between TPC and module, used to assign the light triggers to a module
+    # (-1 for the TPCs missing from the module map)
+    tpc_to_module = np.full(max(detector.TPC_TO_MODULE, default=-1) + 1, -1, dtype=int)
+    for tpc, module in detector.TPC_TO_MODULE.items():
+        tpc_to_module[tpc] = module
+
     # accumulate results for periodic file saving
     results_acc = defaultdict(list)
     def save_results(event_times, is_first_event, results):
@@ -385,13 +489,18 @@ def run_simulation(input_filename,
         Note: can't handle empty inputs
         '''
         for key in list(results.keys()):
-            results[key] = np.concatenate([cp.asnumpy(arr) for arr in results[key]], axis=0)
+            if all(isinstance(arr, np.ndarray) for arr in results[key]):
+                results[key] = np.concatenate(results[key], axis=0)
+            else:
+                # concatenate on the device, so that each key is copied to the host only once
+                results[key] = cp.concatenate([cp.asarray(arr) for arr in results[key]], axis=0).get()
 
         uniq_events = cp.asnumpy(np.unique(results['event_id']))
         uniq_event_times = cp.asnumpy(event_times[uniq_events])
         if light.LIGHT_SIMULATED:
             # prep arrays for embedded triggers in charge data stream
-            light_trigger_modules = np.array([detector.TPC_TO_MODULE[tpc] for tpc in light.OP_CHANNEL_TO_TPC[results['light_op_channel_idx']][:,0]])
+            light_trigger_modules = tpc_to_module[light.OP_CHANNEL_TO_TPC[results['light_op_channel_idx']][:,0]]
+            assert np.all(light_trigger_modules >= 0), "Light trigger in a TPC missing from the TPC to module map"
             light_trigger_times = results['light_start_time'] + results['light_trigger_idx'] * light.LIGHT_TICK_SIZE
             light_trigger_event_ids = results['light_event_id']
         else:
@@ -428,16 +537,24 @@ def run_simulation(input_filename,
 
         return event_times[-1]
 
+    # the tracks of the next batch are copied on these non-blocking streams,
+    # so that the copy overlaps with the simulation of the current batch
+    copy_streams = [cp.cuda.Stream(non_blocking=True) for _ in range(2)]
+
     last_time = 0
-    for batch_mask in tqdm(batching.TPCBatcher(tracks, sim.EVENT_SEPARATOR, tpc_batch_size=sim.EVENT_BATCH_SIZE, tpc_borders=detector.TPC_BORDERS),
-                           desc='Simulating batches...', ncols=80, smoothing=0):
-        # grab only tracks from current batch
-        track_subset = tracks[batch_mask]
+    for batch_mask, track_subset, d_track_subset, copy_done in tqdm(
+            prefetch_batches(tracks, batcher, [external_stream(s.ptr) for s in copy_streams], stream),
+            total=len(batcher), desc='Simulating batches...', ncols=80, smoothing=0):
         if len(track_subset) == 0:
             continue
+        copy_done.wait(stream)
         ievd = int(track_subset[0][sim.EVENT_SEPARATOR])
         evt_tracks = track_subset
-        first_trk_id = np.argmax(batch_mask) # first track in batch
+        # indices of the tracks in the batch, so that the sub-batches do not
+        # have to apply the mask again
+        batch_indices = np.flatnonzero(batch_mask)
+        batch_track_ids = track_ids[cp.asarray(batch_indices)]
+        first_trk_id = batch_indices[0] # first track in batch
 
         for itrk in tqdm(range(0, evt_tracks.shape[0], sim.BATCH_SIZE),
                          delay=1, desc='  Simulating event %i batches...' % ievd, leave=False, ncols=80):
@@ -445,6 +562,7 @@ def run_simulation(input_filename,
                 warnings.warn(f"Entered sub-batch loop, results may not be accurate! Consider increasing batch_size (currently {sim.BATCH_SIZE}) in the simulation_properties file.")
                 
             selected_tracks = evt_tracks[itrk:itrk+sim.BATCH_SIZE]
+            d_selected_tracks = d_track_subset[itrk:itrk+sim.BATCH_SIZE]
 
             RangePush("event_id_map")
             event_ids = selected_tracks[sim.EVENT_SEPARATOR]
@@ -457,122 +575,109 @@ def run_simulation(input_filename,
             RangePush("pixels_from_track")
             max_radius = ceil(max(selected_tracks["tran_diff"])*5/detector.PIXEL_PITCH)
 
-            TPB = 128
-            BPG = max(ceil(selected_tracks.shape[0] / TPB),1)
-            max_pixels = np.array([0])
-            pixels_from_track.max_pixels[BPG,TPB](selected_tracks, max_pixels)
+            # The array sizes are computed from the host copy of the tracks, so that
+            # the device does not have to be synchronized to read them back
+            max_pixels = pixels_from_track.get_max_pixels(selected_tracks)
+            # Here we find the longest signal in time and we store an array with the start in time of each track
+            track_starts, max_length = detsim.get_time_intervals(selected_tracks)
+            track_starts = cp.asarray(track_starts)
 
             # This formula tries to estimate the maximum number of pixels which can have
             # a current induced on them.
-            max_neighboring_pixels = (2*max_radius+1)*max_pixels[0]+(1+2*max_radius)*max_radius*2
+            max_neighboring_pixels = (2*max_radius+1)*max_pixels+(1+2*max_radius)*max_radius*2
 
-            active_pixels = cp.full((selected_tracks.shape[0], max_pixels[0]), -1, dtype=np.int32)
-            neighboring_pixels = cp.full((selected_tracks.shape[0], max_neighboring_pixels), -1, dtype=np.int32)
-            n_pixels_list = cp.zeros(shape=(selected_tracks.shape[0]))
+            # The pixels are stored pixel-major and passed as transposed views, so that
+            # get_pixels threads (one per track) write to consecutive addresses
+            active_pixels = cp.full((max_pixels, selected_tracks.shape[0]), -1, dtype=np.int32).T
+            neighboring_pixels = cp.full((max_neighboring_pixels, selected_tracks.shape[0]), -1, dtype=np.int32).T
+            n_pixels_list = cp.zeros(shape=(selected_tracks.shape[0]), dtype=np.int32)
 
             if not active_pixels.shape[1] or not neighboring_pixels.shape[1]:
                 continue
 
-            pixels_from_track.get_pixels[BPG,TPB](selected_tracks,
-                                                  active_pixels,
-                                                  neighboring_pixels,
-                                                  n_pixels_list,
-                                                  max_radius)
+            pixels_from_track.get_pixels.forall(selected_tracks.shape[0], stream=stream)(
+                d_selected_tracks,
+                active_pixels,
+                neighboring_pixels,
+                n_pixels_list,
+                max_radius)
             RangePop()
 
             RangePush("unique_pix")
-            shapes = neighboring_pixels.shape
-            joined = neighboring_pixels.reshape(shapes[0] * shapes[1])
-            unique_pix = cp.unique(joined)
-            unique_pix = unique_pix[(unique_pix != -1)]
+            # the pixel-major storage is flattened without a copy
+            joined = neighboring_pixels.T.ravel()
+            # empty entries are marked with -1 and are left out of the sort
+            valid = joined != -1
+            # the inverse gives the map between tracks and index in the unique pixel array
+            unique_pix, valid_index = cp.unique(joined[valid], return_inverse=True)
+            pixel_index_map = cp.full(joined.shape, -1, dtype=np.int32)
+            pixel_index_map[valid] = valid_index
+            pixel_index_map = pixel_index_map.reshape(neighboring_pixels.T.shape).T
+            # (track, pixel) index pairs of the valid entries, so that the current
+            # calculation is launched only on them
+            pair_index = cp.flatnonzero(valid).astype(np.int32)
+            active_pairs = cp.stack((pair_index % neighboring_pixels.shape[0],
+                                     pair_index // neighboring_pixels.shape[0]), axis=1)
             RangePop()
 
             if not unique_pix.shape[0]:
                 continue
 
-            RangePush("time_intervals")
-            # Here we find the longest signal in time and we store an array with the start in time of each track
-            max_length = cp.array([0])
-            track_starts = cp.empty(selected_tracks.shape[0])
-            detsim.time_intervals[BPG,TPB](track_starts, max_length, selected_tracks)
-            RangePop()
-
-            RangePush("tracks_current")
-            # Here we calculate the induced current on each pixel
-            signals = cp.zeros((selected_tracks.shape[0],
-                                neighboring_pixels.shape[1],
-                                cp.asnumpy(max_length)[0]), dtype=np.float32)
-            TPB = (1,1,64)
-            BPG_X = max(ceil(signals.shape[0] / TPB[0]),1)
-            BPG_Y = max(ceil(signals.shape[1] / TPB[1]),1)
-            BPG_Z = max(ceil(signals.shape[2] / TPB[2]),1)
-            BPG = (BPG_X, BPG_Y, BPG_Z)
-            rng_states = maybe_create_rng_states(int(np.prod(TPB[:2]) * np.prod(BPG[:2])), seed=rand_seed+ievd+itrk, rng_states=rng_states)
-            detsim.tracks_current_mc[BPG,TPB](signals, neighboring_pixels, selected_tracks, response, rng_states)
-            RangePop()
-
-            RangePush("pixel_index_map")
-            # Here we create a map between tracks and index in the unique pixel array
-            pixel_index_map = cp.full((selected_tracks.shape[0], neighboring_pixels.shape[1]), -1)
-            for i_ in range(selected_tracks.shape[0]):
-                compare = neighboring_pixels[i_, ..., cp.newaxis] == unique_pix
-                indices = cp.where(compare)
-                pixel_index_map[i_, indices[0]] = indices[1]
-            RangePop()
-
             RangePush("track_pixel_map")
             # Mapping between unique pixel array and track array index
-            track_pixel_map = cp.full((unique_pix.shape[0], detsim.MAX_TRACKS_PER_PIXEL), -1)
-            TPB = 32
-            BPG = max(ceil(unique_pix.shape[0] / TPB),1)
-            detsim.get_track_pixel_map[BPG, TPB](track_pixel_map, unique_pix, neighboring_pixels)
+            track_pixel_map = detsim.get_track_pixel_map(pixel_index_map, unique_pix.shape[0], detsim.MAX_TRACKS_PER_PIXEL)
             RangePop()
 
-            RangePush("sum_pixels_signals")
-            # Here we combine the induced current on the same pixels by different tracks
-            TPB = (1,1,64)
-            BPG_X = max(ceil(signals.shape[0] / TPB[0]),1)
-            BPG_Y = max(ceil(signals.shape[1] / TPB[1]),1)
-            BPG_Z = max(ceil(signals.shape[2] / TPB[2]),1)
-            BPG = (BPG_X, BPG_Y, BPG_Z)
-            pixels_signals = cp.zeros((len(unique_pix), len(detector.TIME_TICKS)))
+            RangePush("tracks_current")
+            # Here we calculate the induced current on each pixel and we combine the induced
+            # current on the same pixels by different tracks
+            pixels_signals = cp.zeros((len(unique_pix), len(detector.TIME_TICKS)), dtype=np.float32)
             pixels_tracks_signals = cp.zeros((len(unique_pix),
                                               len(detector.TIME_TICKS),
-                                              track_pixel_map.shape[1]))
-            detsim.sum_pixel_signals[BPG,TPB](pixels_signals,
-                                              signals,
-                                              track_starts,
-                                              pixel_index_map,
-                                              track_pixel_map,
-                                              pixels_tracks_signals)
+                                              track_pixel_map.shape[1]), dtype=np.float32)
+            # one thread and one random state for each valid (track, pixel) pair
+            rng_states = maybe_create_rng_states(active_pairs.shape[0], seed=rand_seed+ievd+itrk, rng_states=rng_states)
+            detsim.tracks_current_mc.forall(active_pairs.shape[0], stream=stream)(
+                pixels_signals,
+                pixels_tracks_signals,
+                max_length,
+                active_pairs,
+                neighboring_pixels,
+                d_selected_tracks,
+                response,
+                rng_states,
+                track_starts,
+                pixel_index_map,
+                track_pixel_map)
             RangePop()
 
             RangePush("get_adc_values")
             # Here we simulate the electronics response (the self-triggering cycle) and the signal digitization
-            time_ticks = cp.linspace(0, len(unique_eventIDs) * detector.TIME_INTERVAL[1], pixels_signals.shape[1]+1)
+            time_tick_step = len(unique_eventIDs) * detector.TIME_INTERVAL[1] / pixels_signals.shape[1]
             integral_list = cp.zeros((pixels_signals.shape[0], fee.MAX_ADC_VALUES))
             adc_ticks_list = cp.zeros((pixels_signals.shape[0], fee.MAX_ADC_VALUES))
-            current_fractions = cp.zeros((pixels_signals.shape[0], fee.MAX_ADC_VALUES, track_pixel_map.shape[1]))
+            current_fractions = cp.zeros((pixels_signals.shape[0], fee.MAX_ADC_VALUES, track_pixel_map.shape[1]), dtype=np.float32)
 
             TPB = 128
             BPG = ceil(pixels_signals.shape[0] / TPB)
-            rng_states = maybe_create_rng_states(int(TPB * BPG), seed=rand_seed+ievd+itrk, rng_states=rng_states)
+            rng_states = maybe_create_rng_states(pixels_signals.shape[0], seed=rand_seed+ievd+itrk, rng_states=rng_states)
             pixel_thresholds_lut.tpb = TPB
             pixel_thresholds_lut.bpg = BPG
             pixel_thresholds = pixel_thresholds_lut[unique_pix.ravel()].reshape(unique_pix.shape)
 
-            fee.get_adc_values[BPG, TPB](pixels_signals,
-                                         pixels_tracks_signals,
-                                         time_ticks,
-                                         integral_list,
-                                         adc_ticks_list,
-                                         0,
-                                         rng_states,
-                                         current_fractions,
-                                         pixel_thresholds)
+            fee.get_adc_values.forall(pixels_signals.shape[0], stream=stream)(
+                pixels_signals,
+                pixels_tracks_signals,
+                time_tick_step,
+                integral_list,
+                adc_ticks_list,
+                0,
+                rng_states,
+                current_fractions,
+                pixel_thresholds)
 
             adc_list = fee.digitize(integral_list)
-            adc_event_ids = np.full(adc_list.shape, unique_eventIDs[0]) # FIXME: only works if looping on a single event
+            adc_event_ids = cp.full(adc_list.shape, unique_eventIDs[0]) # FIXME: only works if looping on a single event
             RangePop()
 
             results_acc['event_id'].append(adc_event_ids)
@@ -581,14 +686,14 @@ def run_simulation(input_filename,
             results_acc['unique_pix'].append(unique_pix)
             results_acc['current_fractions'].append(current_fractions)
             #track_pixel_map[track_pixel_map != -1] += first_trk_id + itrk
-            track_pixel_map[track_pixel_map != -1] = track_ids[batch_mask][track_pixel_map[track_pixel_map != -1] + itrk]
+            track_pixel_map[track_pixel_map != -1] = batch_track_ids[track_pixel_map[track_pixel_map != -1] + itrk]
             results_acc['track_pixel_map'].append(track_pixel_map)
 
             # ~~~ Light detector response simulation ~~~
             if light.LIGHT_SIMULATED:
                 RangePush("sum_light_signals")
-                light_inc = light_sim_dat[batch_mask][itrk:itrk+sim.BATCH_SIZE]
-                selected_track_id = track_ids[batch_mask][itrk:itrk+sim.BATCH_SIZE]
+                light_inc = light_sim_dat[batch_indices[itrk:itrk+sim.BATCH_SIZE]]
+                selected_track_id = batch_track_ids[itrk:itrk+sim.BATCH_SIZE]
                 n_light_ticks, light_t_start = light_sim.get_nticks(light_inc)
                 n_light_ticks = min(n_light_ticks,int(5E4))
                 op_channel = light_sim.get_active_op_channel(light_inc)
@@ -596,13 +701,13 @@ def run_simulation(input_filename,
                 n_light_det = op_channel.shape[0]
                 light_sample_inc = cp.zeros((n_light_det,n_light_ticks), dtype='f4')
                 light_sample_inc_true_track_id = cp.full((n_light_det, n_light_ticks, light.MAX_MC_TRUTH_IDS), -1, dtype='i8')
-                light_sample_inc_true_photons = cp.zeros((n_light_det, n_light_ticks, light.MAX_MC_TRUTH_IDS), dtype='f8')
+                light_sample_inc_true_photons = cp.zeros((n_light_det, n_light_ticks, light.MAX_MC_TRUTH_IDS), dtype='f4')
 
                 TPB = (1,64)
                 BPG = (max(ceil(light_sample_inc.shape[0] / TPB[0]),1),
                        max(ceil(light_sample_inc.shape[1] / TPB[1]),1))
-                light_sim.sum_light_signals[BPG, TPB](
-                    selected_tracks, track_light_voxel[batch_mask][itrk:itrk+sim.BATCH_SIZE], selected_track_id,
+                light_sim.sum_light_signals[BPG,TPB,stream](
+                    d_selected_tracks, track_light_voxel[batch_indices[itrk:itrk+sim.BATCH_SIZE]], selected_track_id,
                     light_inc, op_channel, lut, light_t_start, light_sample_inc, light_sample_inc_true_track_id,
                     light_sample_inc_true_photons)
                 RangePop()
@@ -610,21 +715,21 @@ def run_simulation(input_filename,
                     warnings.warn(f"Maximum number of true segments ({light.MAX_MC_TRUTH_IDS}) reached in backtracking info, consider increasing MAX_MC_TRUTH_IDS (larndsim/consts/light.py)")
 
                 RangePush("sim_scintillation")
-                light_sample_inc_scint = cp.zeros_like(light_sample_inc)
+                light_sample_inc_scint = cp.empty_like(light_sample_inc)
                 light_sample_inc_scint_true_track_id = cp.full_like(light_sample_inc_true_track_id, -1)
                 light_sample_inc_scint_true_photons = cp.zeros_like(light_sample_inc_true_photons)
                 light_sim.calc_scintillation_effect[BPG, TPB](
                     light_sample_inc, light_sample_inc_true_track_id, light_sample_inc_true_photons, light_sample_inc_scint,
                     light_sample_inc_scint_true_track_id, light_sample_inc_scint_true_photons)
 
-                light_sample_inc_disc = cp.zeros_like(light_sample_inc)
+                light_sample_inc_disc = cp.empty_like(light_sample_inc)
                 rng_states = maybe_create_rng_states(int(np.prod(TPB) * np.prod(BPG)),
                                                      seed=rand_seed+ievd+itrk, rng_states=rng_states)
                 light_sim.calc_stat_fluctuations[BPG, TPB](light_sample_inc_scint, light_sample_inc_disc, rng_states)
                 RangePop()
 
                 RangePush("sim_light_det_response")
-                light_response = cp.zeros_like(light_sample_inc)
+                light_response = cp.empty_like(light_sample_inc)
                 light_response_true_track_id = cp.full_like(light_sample_inc_true_track_id, -1)
                 light_response_true_photons = cp.zeros_like(light_sample_inc_true_photons)
                 light_sim.calc_light_detector_response[BPG, TPB](
@@ -657,12 +762,12 @@ def run_simulation(input_filename,
                 results_acc['light_waveforms_true_track_id'].append(light_digit_signal_true_track_id)
                 results_acc['light_waveforms_true_photons'].append(light_digit_signal_true_photons)
 
-        if len(results_acc['event_id']) > sim.WRITE_BATCH_SIZE and len(np.concatenate(results_acc['event_id'], axis=0)) > 0:
+        if len(results_acc['event_id']) > sim.WRITE_BATCH_SIZE and any(len(ids) for ids in results_acc['event_id']):
             last_time = save_results(event_times, is_first_event=last_time==0, results=results_acc)
             results_acc = defaultdict(list)
 
     # Always save results after last iteration
-    if len(results_acc['event_id']) >0 and len(np.concatenate(results_acc['event_id'], axis=0)) > 0:
+    if any(len(ids) for ids in results_acc['event_id']):
         save_results(event_times, is_first_event=last_time==0, results=results_acc)
 
     with h5py.File(output_filename, 'a') as output_file:
@@ -43,6 +43,8 @@ exclude_patterns = ['tests/*']
 intersphinx_mapping = {'numpy': ('http://docs.scipy.org/doc/numpy/', None),
                        'numba': ('https://numba.pydata.org/numba-doc/latest', None)}
 napoleon_use_param = False
+# cupy needs a GPU and is not installed on the docs builder
+autodoc_mock_imports = ['cupy']
 
 # -- Options for HTML output -------------------------------------------------
 
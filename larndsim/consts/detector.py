@@ -4,6 +4,10 @@ Set detector constants
 
 import numpy as np
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 from collections import defaultdict
 
@@ -141,7 +145,7 @@ def set_detector_properties(detprop_file, pixel_file):
     global TPC_OFFSETS
 
     with open(detprop_file) as df:
-        detprop = yaml.load(df, Loader=yaml.FullLoader)
+        detprop = yaml.load(df, Loader=SafeLoader)
 
     DRIFT_LENGTH = detprop['drift_length']
 
@@ -166,7 +170,7 @@ def set_detector_properties(detprop_file, pixel_file):
     RESPONSE_BIN_SIZE = detprop.get('response_bin_size', RESPONSE_BIN_SIZE)
 
     with open(pixel_file, 'r') as pf:
-        tile_layout = yaml.load(pf, Loader=yaml.FullLoader)
+        tile_layout = yaml.load(pf, Loader=SafeLoader)
 
     PIXEL_PITCH = tile_layout['pixel_pitch'] * mm / cm
     chip_channel_to_position = tile_layout['chip_channel_to_position']
@@ -2,6 +2,10 @@
 Sets ligth-related constants
 """
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 import numpy as np
 import os
 
@@ -100,7 +104,7 @@ def set_light_properties(detprop_file):
     global LIGHT_NBIT
 
     with open(detprop_file) as df:
-        detprop = yaml.load(df, Loader=yaml.FullLoader)
+        detprop = yaml.load(df, Loader=SafeLoader)
 
     try:
         MAX_MC_TRUTH_IDS = detprop.get('max_light_truth_ids',0)
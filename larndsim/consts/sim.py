@@ -4,6 +4,10 @@ Set simulation options
 
 import numpy as np
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 from collections import defaultdict
 
@@ -37,7 +41,7 @@ def set_simulation_properties(simprop_file):
     
 
     with open(simprop_file) as df:
-        simprop = yaml.load(df, Loader=yaml.FullLoader)
+        simprop = yaml.load(df, Loader=SafeLoader)
 
     BATCH_SIZE = simprop['batch_size']
     EVENT_BATCH_SIZE = simprop['event_batch_size']
@@ -3,8 +3,9 @@ Module that calculates the current induced by edep-sim track segments
 on the pixels
 """
 
-from math import pi, ceil, sqrt, erf, exp, log
+from math import pi, ceil, floor, sqrt, erf, exp
 
+import numpy as np
 import numba as nb
 
 from numba import cuda
@@ -18,31 +19,28 @@ MAX_TRACKS_PER_PIXEL = 5
 MIN_STEP_SIZE = 0.001 # cm
 MC_SAMPLE_MULTIPLIER = 1
 
-@cuda.jit
-def time_intervals(track_starts, time_max, tracks):
+def get_time_intervals(tracks):
     """
-    Find the value of the longest signal time and stores the start
-    time of each segment.
+    Find the value of the longest signal time and the start time of each
+    segment on the host, so that they don't have to be read back from the
+    device.
 
     Args:
-        track_starts (:obj:`numpy.ndarray`): array where
-            we store the segments start time
-        time_max (:obj:`numpy.ndarray`): array where we store
-            the longest signal time
         tracks (:obj:`numpy.ndarray`): array containing the segment
             information
+
+    Returns:
+        tuple: start time of each segment (:obj:`numpy.ndarray`) and
+            number of time ticks of the longest signal (int)
     """
-    itrk = cuda.grid(1)
+    t_end = np.round((tracks["t_end"].astype(np.float64) + 1) / detector.TIME_SAMPLING) * detector.TIME_SAMPLING
+    t_start = np.round((tracks["t_start"].astype(np.float64) - detector.TIME_PADDING) / detector.TIME_SAMPLING) * detector.TIME_SAMPLING
+    t_length = t_end - t_start
+    max_length = int(np.ceil(t_length / detector.TIME_SAMPLING).max(initial=0))
 
-    if itrk < tracks.shape[0]:
-        track = tracks[itrk]
-        t_end = round((track["t_end"] + 1) / detector.TIME_SAMPLING) * detector.TIME_SAMPLING
-        t_start = round((track["t_start"] - detector.TIME_PADDING) / detector.TIME_SAMPLING) * detector.TIME_SAMPLING
-        t_length = t_end - t_start
-        track_starts[itrk] = t_start
-        cuda.atomic.max(time_max, 0, ceil(t_length / detector.TIME_SAMPLING))
+    return t_start.astype(np.float32), max_length
 
-@nb.njit
+@nb.njit(fastmath=True)
 def z_interval(start_point, end_point, x_p, y_p, tolerance):
     """
     Here we calculate the interval in the drift direction for the pixel pID
@@ -84,14 +82,11 @@ def z_interval(start_point, end_point, x_p, y_p, tolerance):
     length = sqrt((end[0]-start[0])**2+(end[1]-start[1])**2+(end[2]-start[2])**2)
     dir3D = (end[0] - start[0])/length, (end[1] - start[1])/length, (end[2] - start[2])/length
 
-    if x_poca < start[0]:
-        doca = sqrt((x_p - start[0])**2 + (y_p - start[1])**2)
-        x_poca = start[0]
-    elif x_poca > end[0]:
-        doca = sqrt((x_p - end[0])**2 + (y_p - end[1])**2)
-        x_poca = end[0]
-    else:
-        doca = abs(a*x_p+b*y_p+c)/sqrt(a*a+b*b)
+    # the POCA is clamped to the segment, where the distance from the closest
+    # point of the line is the distance from the nearest endpoint
+    x_poca = min(max(x_poca, start[0]), end[0])
+    y_poca = ys + (x_poca - xs) * m
+    doca = sqrt((x_p - x_poca)**2 + (y_p - y_poca)**2)
 
     z_poca = start[2] + (x_poca - start[0])/dir3D[0]*dir3D[2]
 
@@ -114,54 +109,102 @@ def z_interval(start_point, end_point, x_p, y_p, tolerance):
 
     return 0, 0, 0
 
-@nb.njit
-def _b(x, y, z, start, sigmas, segment, Deltar):
-    return -((x-start[0]) / (sigmas[0]*sigmas[0]) * (segment[0]/Deltar) + \
-             (y-start[1]) / (sigmas[1]*sigmas[1]) * (segment[1]/Deltar) + \
-             (z-start[2]) / (sigmas[2]*sigmas[2]) * (segment[2]/Deltar))
-
-@nb.njit
-def rho(point, q, start, sigmas, segment):
+@nb.njit(fastmath=True)
+def rho_setup(q, sigmas, segment):
     """
-    Function that returns the amount of charge at a certain point in space
+    Function that returns the terms of the charge distribution of :func:`rho`
+    which do not depend on the point in space
 
     Args:
-        point (tuple): point coordinates
         q (float): total charge
-        start (tuple): segment start coordinates
         sigmas (tuple): diffusion coefficients
         segment (tuple): segment sizes
 
     Returns:
-        float: the amount of charge at `point`.
+        tuple: segment length, quadratic coefficient `a`, normalization factor,
+        `2*sqrt(a)` and the segment direction scaled by the diffusion coefficients
     """
-    x, y, z = point
     Deltax, Deltay, Deltaz = segment[0], segment[1], segment[2]
     Deltar = sqrt(Deltax**2+Deltay**2+Deltaz**2)
-    a = ((Deltax/Deltar) * (Deltax/Deltar) / (2*sigmas[0]*sigmas[0]) + \
-         (Deltay/Deltar) * (Deltay/Deltar) / (2*sigmas[1]*sigmas[1]) + \
-         (Deltaz/Deltar) * (Deltaz/Deltar) / (2*sigmas[2]*sigmas[2]))
+    sx = Deltax/Deltar/sigmas[0]
+    sy = Deltay/Deltar/sigmas[1]
+    sz = Deltaz/Deltar/sigmas[2]
+    a = (sx*sx + sy*sy + sz*sz) / 2
     factor = q/Deltar/(sigmas[0]*sigmas[1]*sigmas[2]*sqrt(8*pi*pi*pi))
     sqrt_a_2 = 2*sqrt(a)
 
-    b = _b(x, y, z, start, sigmas, segment, Deltar)
+    return Deltar, a, factor, sqrt_a_2, sx, sy, sz
 
-    delta = (x-start[0])*(x-start[0])/(2*sigmas[0]*sigmas[0]) + \
-            (y-start[1])*(y-start[1])/(2*sigmas[1]*sigmas[1]) + \
-            (z-start[2])*(z-start[2])/(2*sigmas[2]*sigmas[2])
+@nb.njit(fastmath=True)
+def rho_from_terms(b, delta, setup):
+    """
+    Function that returns the amount of charge at a certain point in space,
+    given the point-dependent terms of the charge distribution
+
+    Args:
+        b (float): linear coefficient, minus the scalar product of the scaled
+            offset of the point from the segment start and the scaled direction
+        delta (float): half the squared scaled offset of the point from the
+            segment start
+        setup (tuple): output of :func:`rho_setup` for this segment
+
+    Returns:
+        float: the amount of charge at the point.
+    """
+    Deltar, a, factor, sqrt_a_2, _, _, _ = setup
 
     integral = sqrt(pi) * \
                (-erf(b/sqrt_a_2) + erf((b + 2*a*Deltar)/sqrt_a_2)) / \
                sqrt_a_2
 
-    expo = 0
+    return factor * integral * exp(b*b/(4*a) - delta)
 
-    if factor and integral:
-        expo = exp(b*b/(4*a) - delta + log(factor) + log(integral))
+@nb.njit(fastmath=True)
+def rho_point(point, start, sigmas, setup):
+    """
+    Function that returns the amount of charge at a certain point in space,
+    given the point-independent terms computed by :func:`rho_setup`
 
-    return expo
+    Args:
+        point (tuple): point coordinates
+        start (tuple): segment start coordinates
+        sigmas (tuple): diffusion coefficients
+        setup (tuple): output of :func:`rho_setup` for this segment
 
-@nb.njit
+    Returns:
+        float: the amount of charge at `point`.
+    """
+    x, y, z = point
+    _, _, _, _, sx, sy, sz = setup
+
+    # distance from the segment start in units of the diffusion coefficients
+    ux = (x-start[0])/sigmas[0]
+    uy = (y-start[1])/sigmas[1]
+    uz = (z-start[2])/sigmas[2]
+
+    b = -(ux*sx + uy*sy + uz*sz)
+    delta = (ux*ux + uy*uy + uz*uz) / 2
+
+    return rho_from_terms(b, delta, setup)
+
+@nb.njit(fastmath=True)
+def rho(point, q, start, sigmas, segment):
+    """
+    Function that returns the amount of charge at a certain point in space
+
+    Args:
+        point (tuple): point coordinates
+        q (float): total charge
+        start (tuple): segment start coordinates
+        sigmas (tuple): diffusion coefficients
+        segment (tuple): segment sizes
+
+    Returns:
+        float: the amount of charge at `point`.
+    """
+    return rho_point(point, start, sigmas, rho_setup(q, sigmas, segment))
+
+@nb.njit(fastmath=True)
 def track_point(start, direction, z):
     """
     This function returns the segment coordinates for a point along the `z` coordinate
@@ -220,7 +263,7 @@ def get_closest_waveform(x, y, t, response):
 
     return 0
 
-@nb.njit
+@nb.njit(fastmath=True)
 def overlapping_segment(x, y, start, end, radius):
     """
     Calculates the segment of the track defined by start, end that overlaps
@@ -258,32 +301,52 @@ def overlapping_segment(x, y, start, end, radius):
 
     return new_start, new_end
 
-@cuda.jit
-def tracks_current_mc(signals, pixels, tracks, response, rng_states):
+@cuda.jit(fastmath=True)
+def tracks_current_mc(pixels_signals, pixels_tracks_signals, n_ticks, active_pairs, pixels, tracks, response,
+                      rng_states, track_starts, pixel_index_map, track_pixel_map):
     """
     This CUDA kernel calculates the charge induced on the pixels by the input tracks using a
-    MC method
+    MC method and sums the induced current signals on the same pixel.
 
     Args:
-        signals (:obj:`numpy.ndarray`): empty 3D array with dimensions S x P x T,
-            where S is the number of track segments, P is the number of pixels, and T is
-            the number of time ticks. The output is stored here.
+        pixels_signals (:obj:`numpy.ndarray`): zero-initialized 2D array that will contain the
+            summed signal for each pixel. First dimension is the pixel ID, second
+            dimension is the time tick
+        pixels_tracks_signals (:obj:`numpy.ndarray`): zero-initialized 3D array that will contain
+            the waveforms for each pixel and each track that induced current on the pixel.
+        n_ticks (int): number of time ticks T of the longest signal
+        active_pairs (:obj:`numpy.ndarray`): 2D array with dimensions N x 2 containing the
+            (segment, pixel) index pairs of the N valid entries of `pixels`
         pixels (:obj:`numpy.ndarray`): 2D array with dimensions S x P , where S is
             the number of track segments, P is the number of pixels and contains the pixel ID number.
         tracks (:obj:`numpy.ndarray`): 2D array containing the detector segments.
         response (:obj:`numpy.ndarray`): 3D array containing the tabulated response.
         rng_states (:obj:`numpy.ndarray`): array of random states for noise
-            generation
+            generation, one for each (segment, pixel) pair of `active_pairs`
+        track_starts (:obj:`numpy.ndarray`): 1D array containing the starting time of
+            each track
+        pixel_index_map (:obj:`numpy.ndarray`): 2D array containing the correspondence between
+            the track index and the pixel ID index.
+        track_pixel_map (:obj:`numpy.ndarray`): 2D array containing the association between
+            the unique pixels array and the array containing the pixels for each track.
+
+    The kernel runs on a 1D grid of N threads, so that no thread is spent on the empty
+    entries of `pixels`. Each thread computes the time ticks of a (segment, pixel) pair
+    in sequence, drawing the diffusion of the charges from the random state of the pair,
+    and adds them to the pixel waveforms. The number of random states does not depend
+    on the number of time ticks.
     """
-    itrk, ipix, it = cuda.grid(3)
-    ntrk, _, _ = cuda.gridsize(3)
+    ipair = cuda.grid(1)
 
-    if itrk < signals.shape[0] and ipix < signals.shape[1] and it < signals.shape[2]:
+    if ipair < active_pairs.shape[0]:
+        itrk = active_pairs[ipair][0]
+        ipix = active_pairs[ipair][1]
         t = tracks[itrk]
         pID = pixels[itrk][ipix]
         pID_x, pID_y, pID_plane = id2pixel(pID)
+        pixel_index = pixel_index_map[itrk][ipix]
 
-        if pID_x >= 0 and pID_y >= 0:
+        if pID_x >= 0 and pID_y >= 0 and pixel_index >= 0:
 
             # Pixel coordinates
             x_p, y_p = get_pixel_coordinates(pID)
@@ -298,9 +361,6 @@ def tracks_current_mc(signals, pixels, tracks, response, rng_states):
                 start = (t["x_end"], t["y_end"], t["z_end"])
 
             t_start = round((t["t_start"]-t["t0_start"]-detector.TIME_PADDING) / detector.TIME_SAMPLING) * detector.TIME_SAMPLING
-            time_tick = t_start + it * detector.TIME_SAMPLING
-            if time_tick < 0:
-                return
 
             segment = (end[0]-start[0], end[1]-start[1], end[2]-start[2])
             length = sqrt(segment[0]**2 + segment[1]**2 + segment[2]**2)
@@ -323,52 +383,73 @@ def tracks_current_mc(signals, pixels, tracks, response, rng_states):
             step = subsegment_length / nstep # refine step size
 
             charge = t["n_electrons"] * (subsegment_length/length) / (nstep*MC_SAMPLE_MULTIPLIER)
-            total_current = 0
-            rng_state = (rng_states[itrk + ntrk * ipix],)
-            for istep in range(nstep):
-                for _ in range(MC_SAMPLE_MULTIPLIER):
-                    x = subsegment_start[0] + step * (istep + 0.5) * direction[0]
-                    y = subsegment_start[1] + step * (istep + 0.5) * direction[1]
-                    z = subsegment_start[2] + step * (istep + 0.5) * direction[2]
-
-                    z += xoroshiro128p_normal_float32(rng_state, 0) * sigmas[2]
-                    t0 = abs(z - TPC_BORDERS[t["pixel_plane"]][2][0]) / detector.V_DRIFT - detector.TIME_WINDOW
-                    if not t0 < time_tick < t0 + detector.TIME_WINDOW:
-                        continue
 
-                    x += xoroshiro128p_normal_float32(rng_state, 0) * sigmas[0]
-                    y += xoroshiro128p_normal_float32(rng_state, 0) * sigmas[1]
-                    x_dist = abs(x_p - x)
-                    y_dist = abs(y_p - y)
+            start_tick = round(track_starts[itrk] / detector.TIME_SAMPLING)
+            counter = 0
+            for track_idx in range(track_pixel_map[pixel_index].shape[0]):
+                if itrk == int(track_pixel_map[pixel_index][track_idx]):
+                    counter = track_idx
+                    break
 
-                    if x_dist > detector.RESPONSE_BIN_SIZE * response.shape[0]:
-                        continue
-                    if y_dist > detector.RESPONSE_BIN_SIZE * response.shape[1]:
-                        continue
+            for it in range(n_ticks):
+                time_tick = t_start + it * detector.TIME_SAMPLING
+                itime = start_tick + it
+                if time_tick < 0 or itime < 0 or itime >= pixels_signals.shape[1]:
+                    continue
+
+                total_current = 0
+                for istep in range(nstep):
+                    for _ in range(MC_SAMPLE_MULTIPLIER):
+                        x = subsegment_start[0] + step * (istep + 0.5) * direction[0]
+                        y = subsegment_start[1] + step * (istep + 0.5) * direction[1]
+                        z = subsegment_start[2] + step * (istep + 0.5) * direction[2]
+
+                        z += xoroshiro128p_normal_float32(rng_states, ipair) * sigmas[2]
+                        t0 = abs(z - TPC_BORDERS[t["pixel_plane"]][2][0]) / detector.V_DRIFT - detector.TIME_WINDOW
+                        if not t0 < time_tick < t0 + detector.TIME_WINDOW:
+                            continue
+
+                        x += xoroshiro128p_normal_float32(rng_states, ipair) * sigmas[0]
+                        y += xoroshiro128p_normal_float32(rng_states, ipair) * sigmas[1]
+                        x_dist = abs(x_p - x)
+                        y_dist = abs(y_p - y)
 
-                    total_current += charge * get_closest_waveform(x_dist, y_dist, time_tick-t0, response)
+                        if x_dist > detector.RESPONSE_BIN_SIZE * response.shape[0]:
+                            continue
+                        if y_dist > detector.RESPONSE_BIN_SIZE * response.shape[1]:
+                            continue
 
-            signals[itrk,ipix,it] = total_current
+                        total_current += charge * get_closest_waveform(x_dist, y_dist, time_tick-t0, response)
 
+                if total_current != 0:
+                    cuda.atomic.add(pixels_signals, (pixel_index, itime), total_current)
+                    cuda.atomic.add(pixels_tracks_signals, (pixel_index, itime, counter), total_current)
 
-@cuda.jit
+
+@cuda.jit(fastmath=True)
 def tracks_current(signals, pixels, tracks, response):
     """
     This CUDA kernel calculates the charge induced on the pixels by the input tracks.
 
     Args:
-        signals (:obj:`numpy.ndarray`): empty 3D array with dimensions S x P x T,
+        signals (:obj:`numpy.ndarray`): 3D array with dimensions S x P x T,
             where S is the number of track segments, P is the number of pixels, and T is
-            the number of time ticks. The output is stored here.
+            the number of time ticks. The currents are added to it, so it must be
+            zero-initialized by the caller.
         pixels (:obj:`numpy.ndarray`): 2D array with dimensions S x P , where S is
             the number of track segments, P is the number of pixels and contains the pixel ID number.
         tracks (:obj:`numpy.ndarray`): 2D array containing the detector segments.
         response (:obj:`numpy.ndarray`): 3D array containing the tabulated response.
+
+    The kernel runs on a 2D grid of S x P threads, one for each (segment, pixel) pair,
+    and each thread loops on the time ticks. Each thread sets up the sampling
+    volume of its (segment, pixel) pair once and computes the charge of each sampled
+    point once, adding its induced current to all the time ticks.
     """
 
-    itrk, ipix, it = cuda.grid(3)
+    itrk, ipix = cuda.grid(2)
 
-    if itrk < signals.shape[0] and ipix < signals.shape[1] and it < signals.shape[2]:
+    if itrk < signals.shape[0] and ipix < signals.shape[1]:
         t = tracks[itrk]
         pID = pixels[itrk][ipix]
         pID_x, pID_y, pID_plane = id2pixel(pID)
@@ -416,44 +497,59 @@ def tracks_current(signals, pixels, tracks, response):
                 z_step = (z_end_int-z_start_int) / (z_steps-1)
                 t_start = round((t["t_start"]-t["t0_start"]-detector.TIME_PADDING) / detector.TIME_SAMPLING) * detector.TIME_SAMPLING
 
-                total_current = 0
-
-                time_tick = t_start + it * detector.TIME_SAMPLING
-                if time_tick < 0.:
-                    return
+                # the sampling grid is the same for all the z slices
+                x_sign, y_sign = sign(direction[0]), sign(direction[1])
+                x_offset, y_offset = x_start - x_sign * 4*sigmas[0], y_start - y_sign * 4*sigmas[1]
+                cell_volume = abs(x_step) * abs(y_step) * abs(z_step)
+                charge_setup = rho_setup(t["n_electrons"], sigmas, segment)
+                _, _, _, _, sx, sy, sz = charge_setup
 
                 for iz in range(z_steps):
 
                     z = z_start_int + iz*z_step
                     t0 = abs(z - TPC_BORDERS[t["pixel_plane"]][2][0]) / detector.V_DRIFT - detector.TIME_WINDOW
 
-                    if not t0 < time_tick < t0 + detector.TIME_WINDOW:
+                    # the terms of the charge distribution are separable in x, y and z
+                    uz = (z-start[2])/sigmas[2]
+                    b_z, delta_z = uz*sz, uz*uz
+
+                    # range of the non-negative time ticks with t0 < time_tick < t0 + TIME_WINDOW
+                    it_min = max(0, ceil(-t_start / detector.TIME_SAMPLING),
+                                 floor((t0 - t_start) / detector.TIME_SAMPLING) + 1)
+                    it_max = min(signals.shape[2],
+                                 ceil((t0 + detector.TIME_WINDOW - t_start) / detector.TIME_SAMPLING))
+
+                    # no tick is induced by this slice, skip its sampling grid
+                    if it_min >= it_max:
                         continue
 
                     # FIXME: this sampling is far from ideal, we should sample around the track
                     # and not in a cube containing the track
                     for ix in range(detector.SAMPLED_POINTS):
 
-                        x = x_start + sign(direction[0]) * (ix*x_step - 4*sigmas[0])
+                        x = x_offset + x_sign * ix*x_step
                         x_dist = abs(x_p - x)
 
                         if x_dist > detector.RESPONSE_BIN_SIZE * response.shape[0]:
                             continue
 
+                        ux = (x-start[0])/sigmas[0]
+                        b_xz, delta_xz = ux*sx + b_z, ux*ux + delta_z
+
                         for iy in range(detector.SAMPLED_POINTS):
 
-                            y = y_start + sign(direction[1]) * (iy*y_step - 4*sigmas[1])
+                            y = y_offset + y_sign * iy*y_step
                             y_dist = abs(y_p - y)
 
                             if y_dist > detector.RESPONSE_BIN_SIZE * response.shape[1]:
                                 continue
 
-                            charge = rho((x,y,z), t["n_electrons"], start, sigmas, segment) \
-                                     * abs(x_step) * abs(y_step) * abs(z_step)
+                            uy = (y-start[1])/sigmas[1]
+                            charge = rho_from_terms(-(uy*sy + b_xz), (uy*uy + delta_xz) / 2, charge_setup) * cell_volume
 
-                            total_current += get_closest_waveform(x_dist, y_dist, time_tick-t0, response) * charge
-
-                        signals[itrk,ipix,it] = total_current
+                            for it in range(it_min, it_max):
+                                time_tick = t_start + it * detector.TIME_SAMPLING
+                                signals[itrk,ipix,it] += get_closest_waveform(x_dist, y_dist, time_tick-t0, response) * charge
 
 @nb.njit
 def sign(x):
@@ -488,6 +584,8 @@ def sum_pixel_signals(pixels_signals, signals, track_starts, pixel_index_map, tr
             the unique pixels array and the array containing the pixels for each track.
         pixels_tracks_signals (:obj:`numpy.ndarray`): 3D array that will contain the waveforms
             for each pixel and each track that induced current on the pixel.
+
+    The kernel runs on a 3D grid of S x P x T threads, one for each entry of `signals`.
     """
     itrk, ipix, itick = cuda.grid(3)
 
@@ -515,34 +613,33 @@ def sum_pixel_signals(pixels_signals, signals, track_starts, pixel_index_map, tr
                                     (pixel_index, itime, counter),
                                     signals[itrk][ipix][itick])
 
-@cuda.jit
-def get_track_pixel_map(track_pixel_map, unique_pix, pixels):
+def get_track_pixel_map(pixel_index_map, n_unique_pix, max_tracks):
     """
-    This kernel fills a 2D array which contains, for each unique pixel,
-    an array with the track indeces associated to that pixel.
+    Build the map between the unique pixels and the tracks inducing a
+    signal on them. For each unique pixel the track indices are stored
+    in increasing order, up to `max_tracks` of them.
 
     Args:
-        track_pixel_map (:obj:`numpy.ndarray`): 2D array that will contain the
-            association between the unique pixels array and the track indeces
-        unique_pix (:obj:`numpy.ndarray`): 1D array containing the unique pixels
-        pixels (:obj:`numpy.ndarray`): 2D array containing the pixels for each
-            track.
-    """
-    # index of unique_pix array
-    index = cuda.grid(1)
-
-    upix = unique_pix[index]
+        pixel_index_map (:obj:`numpy.ndarray`): 2D array containing, for each track,
+            the index in the unique pixels array of its pixels (-1 if not valid).
+            It can also be a :obj:`cupy.ndarray`, in which case the map is built on the device.
+        n_unique_pix (int): number of unique pixels.
+        max_tracks (int): maximum number of tracks stored per pixel.
 
-    for itrk in range(pixels.shape[0]):
-
-        for ipix in range(pixels.shape[1]):
-            pID = pixels[itrk][ipix]
-
-            if upix == pID:
-
-                imap = 0
-                while imap < track_pixel_map.shape[1] and track_pixel_map[index][imap] != -1 and track_pixel_map[index][imap] != itrk:
-                    imap += 1
-
-                if imap < track_pixel_map.shape[1]:
-                    track_pixel_map[index][imap] = itrk
+    Returns:
+        :obj:`numpy.ndarray`: 2D array with the track indices of each unique pixel,
+            padded with -1. Same array type as `pixel_index_map`.
+    """
+    n_tracks = pixel_index_map.shape[0]
+    track_index = np.broadcast_to(np.arange(n_tracks, like=pixel_index_map)[:, None], pixel_index_map.shape)
+    valid = pixel_index_map >= 0
+    # the (pixel, track) pairs sorted by pixel and then by track, each pair only once
+    keys = np.unique(pixel_index_map[valid].astype(np.int64) * n_tracks + track_index[valid])
+    upix_index = keys // n_tracks
+    rank = np.arange(keys.shape[0], like=keys) - np.searchsorted(upix_index, upix_index)
+    kept = rank < max_tracks
+
+    track_pixel_map = np.full((n_unique_pix, max_tracks), -1, like=keys)
+    track_pixel_map[upix_index[kept], rank[kept]] = keys[kept] % n_tracks
+
+    return track_pixel_map
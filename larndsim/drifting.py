@@ -8,7 +8,7 @@ from numba import cuda
 from .consts import detector
 from .consts.detector import TPC_BORDERS
 
-@cuda.jit
+@cuda.jit(fastmath=True)
 def drift(tracks):
     """
     This function takes as input an array of track segments and calculates
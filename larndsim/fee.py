@@ -6,6 +6,10 @@ import numpy as np
 import cupy as cp
 import h5py
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 from numba import cuda
 from numba.cuda.random import xoroshiro128p_normal_float32
@@ -164,7 +168,7 @@ def export_to_hdf5(event_id_list,
 
     if bad_channels:
         with open(bad_channels, 'r') as bad_channels_file:
-            bad_channels_list = yaml.load(bad_channels_file, Loader=yaml.FullLoader)
+            bad_channels_list = yaml.load(bad_channels_file, Loader=SafeLoader)
 
     unique_events, unique_events_inv = np.unique(event_id_list[...,0], return_inverse=True)
     event_start_time_list = (event_start_times[unique_events_inv] / CLOCK_CYCLE).astype(int)
@@ -305,18 +309,19 @@ def digitize(integral_list):
         integral_list(:obj:`numpy.ndarray`): list of charge collected by each pixel
 
     Returns:
-        :obj:`numpy.ndarray`: list of ADC values for each pixel
+        :obj:`numpy.ndarray`: list of ADC values for each pixel, using the smallest
+        unsigned integer type that can hold `ADC_COUNTS` values
     """
     xp = cp.get_array_module(integral_list)
     adcs = xp.minimum(xp.around(xp.maximum((integral_list * GAIN + V_PEDESTAL - V_CM), 0)
                                 * ADC_COUNTS / (V_REF - V_CM)), ADC_COUNTS-1)
 
-    return adcs
+    return adcs.astype(np.min_scalar_type(ADC_COUNTS-1))
 
-@cuda.jit
+@cuda.jit(fastmath=True)
 def get_adc_values(pixels_signals,
                    pixels_signals_tracks,
-                   time_ticks,
+                   time_tick_step,
                    adc_list,
                    adc_ticks_list,
                    time_padding,
@@ -331,7 +336,8 @@ def get_adc_values(pixels_signals,
             each pixel
         pixels_signals_tracks (:obj:`numpy.ndarray`): list of induced currents
             for each track that induces current on each pixel
-        time_ticks (:obj:`numpy.ndarray`): list of time ticks for each pixel
+        time_tick_step (float): time interval between two consecutive ticks of
+            `pixels_signals`. The time of the tick `i` is `i * time_tick_step`
         adc_list (:obj:`numpy.ndarray`): list of integrated charges for each
             pixel
         adc_ticks_list (:obj:`numpy.ndarray`): list of the time ticks that
@@ -354,6 +360,14 @@ def get_adc_values(pixels_signals,
         last_reset = 0
         q_sum = xoroshiro128p_normal_float32(rng_states, ip) * RESET_NOISE_CHARGE
 
+        # time intervals in ticks and buffer weights derived from the electronics constants
+        hold_ticks = round((3 * CLOCK_CYCLE + ADC_HOLD_DELAY * CLOCK_CYCLE) / detector.TIME_SAMPLING)
+        reset_ticks = round(RESET_CYCLES * CLOCK_CYCLE / detector.TIME_SAMPLING)
+        busy_ticks = round(ADC_BUSY_DELAY * CLOCK_CYCLE / detector.TIME_SAMPLING)
+        if BUFFER_RISETIME > 0:
+            buffer_ticks = 10 * BUFFER_RISETIME / detector.TIME_SAMPLING
+            buffer_weight = detector.TIME_SAMPLING * (1 - exp(-detector.TIME_SAMPLING / BUFFER_RISETIME))
+
         while ic < curre.shape[0] or adc_busy > 0:
 
             if iadc >= MAX_ADC_VALUES:
@@ -362,13 +376,13 @@ def get_adc_values(pixels_signals,
 
             q = 0
             if BUFFER_RISETIME > 0:
-                conv_start = max(last_reset, floor(ic - 10*BUFFER_RISETIME/detector.TIME_SAMPLING))
+                conv_start = max(last_reset, floor(ic - buffer_ticks))
                 for jc in range(conv_start, min(ic+1, curre.shape[0])):
-                    w = exp((jc - ic) * detector.TIME_SAMPLING / BUFFER_RISETIME) * (1 - exp(-detector.TIME_SAMPLING/BUFFER_RISETIME))
-                    q += curre[jc] * detector.TIME_SAMPLING * w
+                    w = exp((jc - ic) * detector.TIME_SAMPLING / BUFFER_RISETIME) * buffer_weight
+                    q += curre[jc] * w
 
                     for itrk in range(current_fractions.shape[2]):
-                        current_fractions[ip][iadc][itrk] += pixels_signals_tracks[ip][jc][itrk] * detector.TIME_SAMPLING * w
+                        current_fractions[ip][iadc][itrk] += pixels_signals_tracks[ip][jc][itrk] * w
 
             elif ic < curre.shape[0]:
                 q += curre[ic] * detector.TIME_SAMPLING
@@ -384,8 +398,7 @@ def get_adc_values(pixels_signals,
                 adc_busy -= 1
 
             if q_sum + q_noise >= pixel_thresholds[ip] + disc_noise and adc_busy == 0:
-                interval = round((3 * CLOCK_CYCLE + ADC_HOLD_DELAY * CLOCK_CYCLE) / detector.TIME_SAMPLING)
-                integrate_end = ic+interval
+                integrate_end = ic+hold_ticks
 
                 ic+=1
 
@@ -393,13 +406,13 @@ def get_adc_values(pixels_signals,
                     q = 0
 
                     if BUFFER_RISETIME > 0:
-                        conv_start = max(last_reset, floor(ic - 10*BUFFER_RISETIME/detector.TIME_SAMPLING))
+                        conv_start = max(last_reset, floor(ic - buffer_ticks))
                         for jc in range(conv_start, min(ic+1, curre.shape[0])):
-                            w = exp((jc - ic) * detector.TIME_SAMPLING / BUFFER_RISETIME) * (1 - exp(-detector.TIME_SAMPLING/BUFFER_RISETIME))
-                            q += curre[jc] * detector.TIME_SAMPLING * w
+                            w = exp((jc - ic) * detector.TIME_SAMPLING / BUFFER_RISETIME) * buffer_weight
+                            q += curre[jc] * w
 
                             for itrk in range(current_fractions.shape[2]):
-                                current_fractions[ip][iadc][itrk] += pixels_signals_tracks[ip][jc][itrk] * detector.TIME_SAMPLING * w
+                                current_fractions[ip][iadc][itrk] += pixels_signals_tracks[ip][jc][itrk] * w
 
                     elif ic < curre.shape[0]:
                         q += curre[ic] * detector.TIME_SAMPLING
@@ -413,7 +426,7 @@ def get_adc_values(pixels_signals,
                 disc_noise = xoroshiro128p_normal_float32(rng_states, ip) * DISCRIMINATOR_NOISE
 
                 if adc < pixel_thresholds[ip] + disc_noise:
-                    ic += round(RESET_CYCLES * CLOCK_CYCLE / detector.TIME_SAMPLING)
+                    ic += reset_ticks
                     q_sum = xoroshiro128p_normal_float32(rng_states, ip) * RESET_NOISE_CHARGE
 
                     for itrk in range(current_fractions.shape[2]):
@@ -431,15 +444,15 @@ def get_adc_values(pixels_signals,
 
                 adc_list[ip][iadc] = adc
 
-                crossing_time_tick = min((ic, len(time_ticks)-1))
+                crossing_time_tick = min((ic, curre.shape[0]))
                 # handle case when tick extends past end of current array
                 post_adc_ticks = max((ic - crossing_time_tick, 0))
                 #+2-tick delay from when the PACMAN receives the trigger and when it registers it.
-                adc_ticks_list[ip][iadc] = time_ticks[crossing_time_tick]+time_padding-2+post_adc_ticks
+                adc_ticks_list[ip][iadc] = crossing_time_tick*time_tick_step+time_padding-2+post_adc_ticks
 
-                ic += round(RESET_CYCLES * CLOCK_CYCLE / detector.TIME_SAMPLING)
+                ic += reset_ticks
                 last_reset = ic
-                adc_busy = round(ADC_BUSY_DELAY * CLOCK_CYCLE / detector.TIME_SAMPLING)
+                adc_busy = busy_ticks
 
                 q_sum = xoroshiro128p_normal_float32(rng_states, ip) * RESET_NOISE_CHARGE
 
@@ -108,14 +108,16 @@ def calculate_light_incidence(tracks, lut, light_incidence, voxel):
             # Calls T1 data for the voxel
             T1_dat = lut_vox['t0']
 
+            # Segment start time, common to all the channels
+            t0 = tracks['t0'][itrk] * units.mus
+
             # Assigns the LUT data to the light_incidence array
             for output_i in range(light.N_OP_CHANNEL):
-                op_channel_index = output_i
                 lut_index = output_i % vis_dat.shape[0]
 
                 eff = OP_CHANNEL_EFFICIENCY[output_i]
                 vis = vis_dat[lut_index] * (OP_CHANNEL_TO_TPC[output_i] == itpc)
-                t1 = (T1_dat[lut_index] * units.ns + tracks['t0'][itrk] * units.mus) / units.mus
+                t1 = (T1_dat[lut_index] * units.ns + t0) / units.mus
 
-                light_incidence['n_photons_det'][itrk,op_channel_index] = eff * vis * n_photons
-                light_incidence['t0_det'][itrk,op_channel_index] = t1
+                light_incidence['n_photons_det'][itrk,output_i] = eff * vis * n_photons
+                light_incidence['t0_det'][itrk,output_i] = t1
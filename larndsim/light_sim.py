@@ -168,12 +168,14 @@ def calc_scintillation_effect(light_sample_inc, light_sample_inc_true_track_id,
     if idet < light_sample_inc.shape[0]:
         if itick < light_sample_inc.shape[1]:
             conv_ticks = ceil((LIGHT_WINDOW[1] - LIGHT_WINDOW[0])/LIGHT_TICK_SIZE)
+            # the convolution is accumulated locally and stored once
+            scint = 0.
             
             for jtick in range(max(itick - conv_ticks, 0), itick+1):
                 if light_sample_inc[idet,jtick] == 0:
                     continue
                 tick_weight = scintillation_model(itick-jtick)
-                light_sample_inc_scint[idet,itick] += tick_weight * light_sample_inc[idet,jtick]
+                scint += tick_weight * light_sample_inc[idet,jtick]
 
                 # loop over convolution tick truth
                 for itrue in range(light_sample_inc_true_track_id.shape[-1]):
@@ -190,6 +192,8 @@ def calc_scintillation_effect(light_sample_inc, light_sample_inc_true_track_id,
                             light_sample_inc_scint_true_photons[idet,itick,jtrue] += tick_weight * light_sample_inc_true_photons[idet,jtick,itrue]
                             break
 
+            light_sample_inc_scint[idet,itick] = scint
+
 
 @nb.njit
 def xoroshiro128p_poisson_int32(mean, states, index):
@@ -322,10 +326,12 @@ def calc_light_detector_response(light_sample_inc, light_sample_inc_true_track_i
     if idet < light_sample_inc.shape[0]:
         if itick < light_sample_inc.shape[1]:
             conv_ticks = ceil((LIGHT_WINDOW[1] - LIGHT_WINDOW[0])/LIGHT_TICK_SIZE)
+            # the convolution is accumulated locally and stored once
+            response = 0.
             
             for jtick in range(max(itick - conv_ticks, 0), itick+1):
                 tick_weight = sipm_response_model(idet, itick-jtick)
-                light_response[idet,itick] += LIGHT_GAIN[idet] * tick_weight * light_sample_inc[idet,jtick]
+                response += LIGHT_GAIN[idet] * tick_weight * light_sample_inc[idet,jtick]
                     
                 # loop over convolution tick truth
                 for itrue in range(light_sample_inc_true_track_id.shape[-1]):
@@ -342,6 +348,8 @@ def calc_light_detector_response(light_sample_inc, light_sample_inc_true_track_i
                             light_response_true_track_id[idet,itick,jtrue] = light_sample_inc_true_track_id[idet,itick,itrue]
                             light_response_true_photons[idet,itick,jtrue] += tick_weight * light_sample_inc_true_photons[idet,jtick,itrue]
                             break
+
+            light_response[idet,itick] = response
                 
 
 def gen_light_detector_noise(shape, light_det_noise):
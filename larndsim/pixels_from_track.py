@@ -3,6 +3,7 @@ Module that finds which pixels lie on the projection on the anode plane
 of each track segment. It can eventually include also the neighboring
 pixels.
 """
+import numpy as np
 import numba as nb
 from numba import cuda
 from .consts.detector import PIXEL_PITCH, N_PIXELS, TPC_BORDERS
@@ -37,29 +38,29 @@ def id2pixel(pid):
     return (pid % N_PIXELS[0], (pid // N_PIXELS[0]) % N_PIXELS[1],
             (pid // (N_PIXELS[0] * N_PIXELS[1])))
 
-@cuda.jit
-def max_pixels(tracks, n_max_pixels):
+def get_max_pixels(tracks):
     """
-    CUDA kernels that calculates the maximum number of pixels in the
-    selected tracks.
+    Host upper bound of the number of pixels intercepted by the projection
+    of the tracks on the anode plane (see :func:`get_num_active_pixels`).
+    The bound is reached unless the projection leaves the pixel plane.
 
     Args:
         tracks (:obj:`numpy.ndarray`): tracks array.
-        n_max_pixels (:obj:`numpy.ndarray`): array to store the maximum
-            number of pixels in the selected tracks.
-    """
-    itrk = cuda.grid(1)
 
-    if itrk < tracks.shape[0]:
-        t = tracks[itrk]
-        this_border = TPC_BORDERS[int(t["pixel_plane"])]
-        start_pixel = ((t["x_start"] - this_border[0][0]) // PIXEL_PITCH,
-                       (t["y_start"] - this_border[1][0]) // PIXEL_PITCH)
-        end_pixel = ((t["x_end"] - this_border[0][0]) // PIXEL_PITCH,
-                     (t["y_end"]- this_border[1][0]) // PIXEL_PITCH)
-        n_active_pixels = get_num_active_pixels(start_pixel[0], start_pixel[1],
-                                                end_pixel[0], end_pixel[1], t["pixel_plane"])
-        cuda.atomic.max(n_max_pixels, 0, n_active_pixels)
+    Returns:
+        int: maximum number of pixels in the selected tracks.
+    """
+    planes = tracks["pixel_plane"].astype(np.int64)
+    valid = (planes >= 0) & (planes < TPC_BORDERS.shape[0])
+    borders = TPC_BORDERS[planes[valid]]
+    # each step of the line drawing algorithm moves along either x or y
+    n_active_pixels = np.ones(planes[valid].shape[0], dtype=np.int64)
+    for iaxis, axis in enumerate(("x", "y")):
+        start_pixel = (tracks[axis + "_start"][valid] - borders[:, iaxis, 0]) // PIXEL_PITCH
+        end_pixel = (tracks[axis + "_end"][valid] - borders[:, iaxis, 0]) // PIXEL_PITCH
+        n_active_pixels += np.abs(end_pixel - start_pixel).astype(np.int64)
+
+    return int(n_active_pixels.max(initial=0))
 
 @cuda.jit
 def get_pixels(tracks, active_pixels, neighboring_pixels, n_pixels_list, radius):
@@ -122,9 +123,9 @@ def get_num_active_pixels(x0, y0, x1, y1, plane_id):
             track on the anode plane.
     """
     dx = abs(x1 - x0)
-    sx = 1 if x0 < x1 else -1
+    sx = 2*int(x0 < x1) - 1
     dy = -abs(y1 - y0)
-    sy = 1 if y0 < y1 else -1
+    sy = 2*int(y0 < y1) - 1
     err = dx + dy
 
     n = 0
@@ -133,14 +134,14 @@ def get_num_active_pixels(x0, y0, x1, y1, plane_id):
 
     while x0 != x1 or y0 != y1:
 
+        # step along x or y, selected arithmetically to avoid a divergent branch
         e2 = 2*err
+        step_x = int(e2 - dy > dx - e2)
+        step_y = 1 - step_x
 
-        if e2 - dy > dx - e2:
-            err += dy
-            x0 += sx
-        else:
-            err += dx
-            y0 += sy
+        err += step_x*dy + step_y*dx
+        x0 += step_x*sx
+        y0 += step_y*sy
 
         if 0 <= x0 < N_PIXELS[0] and 0 <= y0 < N_PIXELS[1] and 0 <= plane_id < TPC_BORDERS.shape[0]:
             n += 1
@@ -166,9 +167,9 @@ def get_active_pixels(x0, y0, x1, y1, plane_id, tot_pixels):
             the segments
     """
     dx = abs(x1 - x0)
-    sx = 1 if x0 < x1 else -1
+    sx = 2*int(x0 < x1) - 1
     dy = -abs(y1 - y0)
-    sy = 1 if y0 < y1 else -1
+    sy = 2*int(y0 < y1) - 1
     err = dx + dy
 
     i = 0
@@ -179,14 +180,14 @@ def get_active_pixels(x0, y0, x1, y1, plane_id, tot_pixels):
     while x0 != x1 or y0 != y1:
         i += 1
 
+        # step along x or y, selected arithmetically to avoid a divergent branch
         e2 = 2*err
+        step_x = int(e2 - dy > dx - e2)
+        step_y = 1 - step_x
 
-        if e2 - dy > dx - e2:
-            err += dy
-            x0 += sx
-        else:
-            err += dx
-            y0 += sy
+        err += step_x*dy + step_y*dx
+        x0 += step_x*sx
+        y0 += step_y*sy
 
         if 0 <= x0 < N_PIXELS[0] and 0 <= y0 < N_PIXELS[1] and 0 <= plane_id < TPC_BORDERS.shape[0]:
             tot_pixels[i] = pixel2id(x0, y0, plane_id)
@@ -217,22 +218,45 @@ def get_neighboring_pixels(active_pixels, radius, neighboring_pixels):
         if active_pixels[pix] == -1:
             continue
 
+        active_x, active_y, plane_id = id2pixel(active_pixels[pix])
+
+        # The pixel has already been included if it lies within the radius
+        # of a previous active pixel. Each step along the track moves by
+        # one pixel, so only the previous 4*radius pixels can be that close.
+        # Their bounding box, widened by the radius, contains all the
+        # pixels that may have been included already
+        first_prev = max(pix - 4*radius, 0)
+        min_x, max_x = N_PIXELS[0], -1
+        min_y, max_y = N_PIXELS[1], -1
+        for prev in range(first_prev, pix):
+            if active_pixels[prev] == -1:
+                continue
+
+            prev_x, prev_y, _ = id2pixel(active_pixels[prev])
+            min_x, max_x = min(min_x, prev_x - radius), max(max_x, prev_x + radius)
+            min_y, max_y = min(min_y, prev_y - radius), max(max_y, prev_y + radius)
+
         for x_r in range(-radius, radius+1):
             for y_r in range(-radius, radius+1):
-                active_x, active_y, plane_id = id2pixel(active_pixels[pix])
                 new_x, new_y = active_x + x_r, active_y + y_r
-                is_unique = True
 
                 if 0 <= new_x < N_PIXELS[0] and 0 <= new_y < N_PIXELS[1] and 0 <= plane_id < TPC_BORDERS.shape[0]:
-                    new_pixel = pixel2id(new_x, new_y, plane_id)
+                    is_unique = True
+
+                    if min_x <= new_x <= max_x and min_y <= new_y <= max_y:
+                        # the most recent active pixels are the closest ones
+                        for prev in range(pix - 1, first_prev - 1, -1):
+                            if active_pixels[prev] == -1:
+                                continue
+
+                            prev_x, prev_y, _ = id2pixel(active_pixels[prev])
 
-                    for ipix in range(neighboring_pixels.shape[0]):
-                        if new_pixel == neighboring_pixels[ipix]:
-                            is_unique = False
-                            break
+                            if abs(prev_x - new_x) <= radius and abs(prev_y - new_y) <= radius:
+                                is_unique = False
+                                break
 
                     if is_unique:
-                        neighboring_pixels[count] = new_pixel
+                        neighboring_pixels[count] = pixel2id(new_x, new_y, plane_id)
                         count += 1
 
     return count
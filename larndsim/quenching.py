@@ -23,22 +23,24 @@ def quench(tracks, mode):
     itrk = cuda.grid(1)
 
     if itrk < tracks.shape[0]:
+        field_density = detector.E_FIELD * detector.LAR_DENSITY
         dEdx = tracks[itrk]["dEdx"]
         dE = tracks[itrk]["dE"]
 
         recomb = 0
         if mode == physics.BOX:
             # Baller, 2013 JINST 8 P08005
-            csi = physics.BOX_BETA * dEdx / (detector.E_FIELD * detector.LAR_DENSITY)
+            csi = physics.BOX_BETA * dEdx / field_density
             recomb = max(0, log(physics.BOX_ALPHA + csi)/csi)
         elif mode == physics.BIRKS:
             # Amoruso, et al NIM A 523 (2004) 275
-            recomb = physics.BIRKS_Ab / (1 + physics.BIRKS_kb * dEdx / (detector.E_FIELD * detector.LAR_DENSITY))
+            recomb = physics.BIRKS_Ab / (1 + physics.BIRKS_kb * dEdx / field_density)
         else:
             raise ValueError("Invalid recombination mode: must be 'physics.BOX' or 'physics.BIRKS'")
 
         if isnan(recomb):
             raise RuntimeError("Invalid recombination value")
 
-        tracks[itrk]["n_electrons"] = recomb * dE / physics.W_ION
-        tracks[itrk]["n_photons"] = (dE/light.W_PH - tracks[itrk]["n_electrons"]) * light.SCINT_PRESCALE
+        n_electrons = recomb * dE / physics.W_ION
+        tracks[itrk]["n_electrons"] = n_electrons
+        tracks[itrk]["n_photons"] = (dE/light.W_PH - n_electrons) * light.SCINT_PRESCALE
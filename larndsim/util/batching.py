@@ -24,12 +24,27 @@ class TPCBatcher(TrackSegmentBatcher):
         self.tpc_borders = np.sort(tpc_borders, axis=-1)
         
         self._simulated = np.zeros_like(self.track_seg['trackID'], dtype=bool)
-        self._events = np.unique(self.track_seg[self.EVENT_SEPARATOR])
+        # group the segments by event once, with a single sort of the event
+        # separator, so that each iteration only looks at the current event
+        event_ids = self.track_seg[self.EVENT_SEPARATOR]
+        self._event_order = np.argsort(event_ids, kind='stable')
+        event_ids = event_ids[self._event_order]
+        if len(event_ids):
+            event_starts = np.flatnonzero(event_ids[1:] != event_ids[:-1]) + 1
+            self._event_bounds = np.concatenate(([0], event_starts, [len(event_ids)]))
+        else:
+            self._event_bounds = np.zeros(1, dtype=int)
+        self._events = event_ids[self._event_bounds[:-1]]
         self._curr_event = 0
         self._curr_tpc = 0
 
 
 
+    @property
+    def events(self):
+        """ Unique values of the event separator, in increasing order """
+        return self._events
+
     def __len__(self):
         return len(self._events) * ceil(self.tpc_borders.shape[0] / self.tpc_batch_size)
 
@@ -47,21 +62,20 @@ class TPCBatcher(TrackSegmentBatcher):
         if self._curr_event >= len(self._events):
             raise StopIteration
         
-        mask = ~self._simulated.copy()
-
         # select only current event
-        mask = mask & (self.track_seg[self.EVENT_SEPARATOR] == self._events[self._curr_event])
+        event_tracks = self._event_order[self._event_bounds[self._curr_event]:self._event_bounds[self._curr_event+1]]
+        event_tracks = event_tracks[~self._simulated[event_tracks]]
 
         # select only tracks in current TPC(s)
-        tpc_mask = np.zeros_like(mask)
         in_active_volume = select_active_volume(
-            self.track_seg,
+            self.track_seg[event_tracks],
             self.tpc_borders[self._curr_tpc:min(self._curr_tpc + self.tpc_batch_size, self.tpc_borders.shape[0])])
-        tpc_mask[in_active_volume] = True
-        
+        batch_tracks = event_tracks[in_active_volume]
+        mask = np.zeros_like(self._simulated)
+        mask[batch_tracks] = True
+
         self._curr_tpc += self.tpc_batch_size
-        mask = mask & tpc_mask
-        self._simulated = self._simulated | mask
+        self._simulated[batch_tracks] = True
 
         return mask
 
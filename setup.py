@@ -2,27 +2,12 @@
 
 VER = "0.3.1"
 
-reqs = ["numpy", "pytest", "numba>=0.52", "larpix-control", "larpix-geometry", "tqdm", "fire"]
+reqs = ["numpy", "pytest", "numba>=0.59", "larpix-control", "larpix-geometry", "tqdm", "fire"]
 
-try:
-    import cupy
-    msg = '''
-    ############ INFORMATION ############
-    Detected and using the installed cupy
-    Version: %s
-    Source : %s
-    #####################################\n
-    '''
-    print(msg % (str(cupy.__version__),str(cupy.__file__)))
-except ImportError:
-    reqs.append('cupy')
-
-import os
-if 'SKIP_CUPY_INSTALL' in os.environ:
-    try:
-        _ = reqs.pop(reqs.index('cupy'))
-    except ValueError:
-        pass
+extras = {
+    "gpu-cu11": ["cupy-cuda11x>=12"],
+    "gpu-cu12": ["cupy-cuda12x>=12"],
+}
 
 import setuptools
 
@@ -36,6 +21,7 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     scripts=["cli/simulate_pixels.py", "cli/dumpTree.py"],
     install_requires=reqs,
+    extras_require=extras,
     classifiers=[
         "Development Status :: 2 - Pre-Alpha",
         "Intended Audience :: by End-User Class :: Developers",
@@ -43,5 +29,5 @@ setuptools.setup(
         "Programming Language :: Python",
         "Topic :: Scientific/Engineering :: Physics"
     ],
-    python_requires='>=3.7',
+    python_requires='>=3.9',
 )
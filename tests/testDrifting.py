@@ -23,10 +23,12 @@ class TestDrifting:
     tracks = np.core.records.fromarrays(tracks.transpose(), 
                                         names="eventID, z_end, trackID, tran_diff, z_start, x_end, y_end, n_electrons, pdgId, x_start, y_start, t_start, dx, long_diff, pixel_plane, t_end, dEdx, dE, t, y, x, z, t0_start, t0_end, t0",
                                         formats = "i8, f8, i8, f8, f8, f8, f8, i8, i8, f8, f8, f8, f8, f8, i8, f8, f8, f8, f8, f8, f8, f8, f8, f8, f8")
-    tracks["z"] = np.random.uniform(detector.TPC_BORDERS[0][2][0], detector.TPC_BORDERS[0][2][1], 1)
-    tracks["x"] = np.random.uniform(detector.TPC_BORDERS[0][0][0], detector.TPC_BORDERS[0][0][1], 1)
-    tracks["y"] = np.random.uniform(detector.TPC_BORDERS[0][1][0], detector.TPC_BORDERS[0][1][1], 1)
-    tracks["n_electrons"] = np.random.uniform(1e6, 1e7, 1)
+    # seeded generator, so that the test is reproducible
+    rng = np.random.default_rng(0)
+    tracks["x"], tracks["y"], tracks["z"], tracks["n_electrons"] = rng.uniform(
+        low=(detector.TPC_BORDERS[0][0][0], detector.TPC_BORDERS[0][1][0], detector.TPC_BORDERS[0][2][0], 1e6),
+        high=(detector.TPC_BORDERS[0][0][1], detector.TPC_BORDERS[0][1][1], detector.TPC_BORDERS[0][2][1], 1e7),
+        size=(tracks.shape[0], 4)).T
 
     def test_lifetime(self):
         """
@@ -34,13 +36,9 @@ class TestDrifting:
         """
         z_anode = detector.TPC_BORDERS[0][2][0]
 
-        drift_distance = np.abs(self.tracks["z"] - z_anode)
-        drift_time = drift_distance / detector.V_DRIFT
-
-        lifetime = np.exp(-drift_time / detector.ELECTRON_LIFETIME)
-
         tracks = self.tracks
-        electrons_anode = tracks["n_electrons"] * lifetime
+        electrons_anode = tracks["n_electrons"] * np.exp(-np.abs(tracks["z"] - z_anode)
+                                                         / (detector.V_DRIFT * detector.ELECTRON_LIFETIME))
 
         TPB = 128
         BPG = ceil(tracks.shape[0] / TPB)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from larndsim import consts
+
+consts.load_properties("larndsim/detector_properties/module0.yaml",
+                       "larndsim/pixel_layouts/multi_tile_layout-2.3.16.yaml",
+                       "larndsim/simulation_properties/singles_sim.yaml")
+
+from larndsim.consts import detector
+
+from larndsim import pixels_from_track
+
+class TestPixelsFromTrack:
+    """
+    Pixels from track testing
+    """
+    n_tracks = 200
+    tracks = np.zeros(n_tracks, dtype=[("x_start", "f4"), ("y_start", "f4"), ("x_end", "f4"), ("y_end", "f4"),
+                                       ("pixel_plane", "i4")])
+    rng = np.random.default_rng(0)
+    tracks["pixel_plane"] = rng.integers(0, detector.TPC_BORDERS.shape[0], n_tracks)
+    borders = detector.TPC_BORDERS[tracks["pixel_plane"]]
+    # the segments can leave the pixel plane by up to 2 cm
+    for iaxis, axis in enumerate(("x", "y")):
+        tracks[axis + "_start"] = rng.uniform(borders[:, iaxis, 0] - 2, borders[:, iaxis, 1] + 2)
+        tracks[axis + "_end"] = tracks[axis + "_start"] + rng.uniform(-5, 5, n_tracks)
+
+    def test_max_pixels(self):
+        max_pixels = pixels_from_track.get_max_pixels(self.tracks)
+
+        for t in self.tracks:
+            this_border = detector.TPC_BORDERS[t["pixel_plane"]]
+            n_pixels = pixels_from_track.get_num_active_pixels(
+                int((t["x_start"] - this_border[0][0]) // detector.PIXEL_PITCH),
+                int((t["y_start"] - this_border[1][0]) // detector.PIXEL_PITCH),
+                int((t["x_end"] - this_border[0][0]) // detector.PIXEL_PITCH),
+                int((t["y_end"] - this_border[1][0]) // detector.PIXEL_PITCH),
+                t["pixel_plane"])
+
+            assert max_pixels >= n_pixels
+
+    def test_no_tracks(self):
+        assert pixels_from_track.get_max_pixels(self.tracks[:0]) == 0
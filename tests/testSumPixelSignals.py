@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import numpy as np
+import pytest
+
+from math import ceil
+
+from larndsim import consts
+
+consts.load_properties("larndsim/detector_properties/module0.yaml",
+                       "larndsim/pixel_layouts/multi_tile_layout-2.3.16.yaml",
+                       "larndsim/simulation_properties/singles_sim.yaml")
+
+from larndsim.consts import detector
+
+from larndsim import detsim
+
+class TestSumPixelSignals:
+    """
+    Pixel signals sum testing
+    """
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 6, size=(4, 5)).astype(np.int32)
+    pixels[0, 3:] = -1
+    signals = rng.uniform(0, 1, size=pixels.shape + (10,)).astype(np.float32)
+    # the first track starts before the first time tick
+    track_starts = np.array([-2, 0, 5, 20]) * detector.TIME_SAMPLING
+
+    def test_sum_pixel_signals(self):
+        valid = self.pixels != -1
+        unique_pix, valid_index = np.unique(self.pixels[valid], return_inverse=True)
+        pixel_index_map = np.full(self.pixels.shape, -1, dtype=np.int32)
+        pixel_index_map[valid] = valid_index
+        track_pixel_map = detsim.get_track_pixel_map(pixel_index_map, unique_pix.shape[0], detsim.MAX_TRACKS_PER_PIXEL)
+
+        n_ticks = 25
+        pixels_signals = np.zeros((unique_pix.shape[0], n_ticks))
+        pixels_tracks_signals = np.zeros((unique_pix.shape[0], n_ticks, track_pixel_map.shape[1]))
+
+        threadsperblock = (1, 1, 8)
+        blockspergrid = tuple(ceil(n / tpb) for n, tpb in zip(self.signals.shape, threadsperblock))
+        detsim.sum_pixel_signals[blockspergrid, threadsperblock](pixels_signals,
+                                                                 self.signals,
+                                                                 self.track_starts,
+                                                                 pixel_index_map,
+                                                                 track_pixel_map,
+                                                                 pixels_tracks_signals)
+
+        expected = np.zeros_like(pixels_tracks_signals)
+        for itrk in range(self.pixels.shape[0]):
+            start_tick = round(self.track_starts[itrk] / detector.TIME_SAMPLING)
+            for ipix in np.flatnonzero(valid[itrk]):
+                pixel_index = pixel_index_map[itrk, ipix]
+                counter = list(track_pixel_map[pixel_index]).index(itrk)
+                for itick in range(self.signals.shape[2]):
+                    if 0 <= start_tick + itick < n_ticks:
+                        expected[pixel_index, start_tick + itick, counter] += self.signals[itrk, ipix, itick]
+
+        assert pixels_tracks_signals == pytest.approx(expected)
+        assert pixels_signals == pytest.approx(expected.sum(axis=2))
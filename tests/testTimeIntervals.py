@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from math import ceil
+
+from numba import cuda
+
+from larndsim import consts
+
+consts.load_properties("larndsim/detector_properties/module0.yaml",
+                       "larndsim/pixel_layouts/multi_tile_layout-2.3.16.yaml",
+                       "larndsim/simulation_properties/singles_sim.yaml")
+
+from larndsim.consts import detector
+
+from larndsim import detsim
+
+@cuda.jit
+def time_intervals_kernel(track_starts, time_max, tracks):
+    """
+    Reference kernel, which finds the start time of each segment and the
+    longest signal time on the device
+    """
+    itrk = cuda.grid(1)
+
+    if itrk < tracks.shape[0]:
+        track = tracks[itrk]
+        t_end = round((track["t_end"] + 1) / detector.TIME_SAMPLING) * detector.TIME_SAMPLING
+        t_start = round((track["t_start"] - detector.TIME_PADDING) / detector.TIME_SAMPLING) * detector.TIME_SAMPLING
+        t_length = t_end - t_start
+        track_starts[itrk] = t_start
+        cuda.atomic.max(time_max, 0, ceil(t_length / detector.TIME_SAMPLING))
+
+class TestTimeIntervals:
+    """
+    Time intervals testing
+    """
+    tracks = np.zeros(100, dtype=[("t_start", "f4"), ("t_end", "f4")])
+    rng = np.random.default_rng(0)
+    tracks["t_start"] = rng.uniform(-10, 1000, tracks.shape[0])
+    tracks["t_end"] = tracks["t_start"] + rng.uniform(0, 50, tracks.shape[0])
+
+    def test_time_intervals(self):
+        track_starts, max_length = detsim.get_time_intervals(self.tracks)
+
+        expected_starts = np.zeros(self.tracks.shape[0], dtype=np.float32)
+        expected_length = np.zeros(1, dtype=np.int64)
+        time_intervals_kernel.forall(self.tracks.shape[0])(expected_starts, expected_length, self.tracks)
+
+        assert np.array_equal(track_starts, expected_starts)
+        assert max_length == expected_length[0]
+
+    def test_no_tracks(self):
+        track_starts, max_length = detsim.get_time_intervals(self.tracks[:0])
+
+        assert track_starts.shape == (0,)
+        assert max_length == 0
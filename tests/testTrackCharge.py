@@ -2,10 +2,24 @@
 
 import random
 import numpy as np
+import numba as nb
 import pytest
 
 from larndsim import detsim
 
+@nb.njit
+def integrate_rho(xx, yy, zz, charge, start, sigmas, segment):
+    """
+    Integrates the charge distribution of the segment on the xx, yy, zz grid
+    """
+    total_charge = 0.
+    for x in xx:
+        for y in yy:
+            for z in zz:
+                total_charge += detsim.rho((x, y, z), charge, start, sigmas, segment)
+
+    return total_charge * (xx[1]-xx[0]) * (yy[1]-yy[0]) * (zz[1]-zz[0])
+
 class TestTrackCharge:
     """
     Track charge calculation testing
@@ -22,10 +36,6 @@ class TestTrackCharge:
 
         segment = self.end-self.start
 
-        calculated_charge = 0
-        for x in xx:
-            for y in yy:
-                for z in zz:
-                    calculated_charge += detsim.rho((x, y, z), self.charge, self.start, self.sigmas, segment) * (xx[1]-xx[0]) * (yy[1]-yy[0]) * (zz[1] - zz[0])
+        calculated_charge = integrate_rho(xx, yy, zz, self.charge, self.start, self.sigmas, segment)
 
         assert calculated_charge == pytest.approx(self.charge, rel=0.05)
\ No newline at end of file
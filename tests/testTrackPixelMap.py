@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from numba import cuda
+
+from larndsim import detsim
+
+@cuda.jit
+def track_pixel_map_kernel(track_pixel_map, unique_pix, pixels):
+    """
+    Reference kernel, which fills the map by looping on all the pixels of
+    all the tracks for each unique pixel
+    """
+    index = cuda.grid(1)
+
+    if index < unique_pix.shape[0]:
+        upix = unique_pix[index]
+
+        for itrk in range(pixels.shape[0]):
+
+            for ipix in range(pixels.shape[1]):
+                pID = pixels[itrk][ipix]
+
+                if upix == pID:
+
+                    imap = 0
+                    while imap < track_pixel_map.shape[1] and track_pixel_map[index][imap] != -1 and track_pixel_map[index][imap] != itrk:
+                        imap += 1
+
+                    if imap < track_pixel_map.shape[1]:
+                        track_pixel_map[index][imap] = itrk
+
+class TestTrackPixelMap:
+    """
+    Track-pixel map testing
+    """
+    # few pixel IDs, so that many tracks share the same pixels, with empty entries
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 30, size=(40, 12)).astype(np.int32)
+    pixels[rng.random(pixels.shape) < 0.3] = -1
+
+    def test_track_pixel_map(self):
+        valid = self.pixels != -1
+        unique_pix, valid_index = np.unique(self.pixels[valid], return_inverse=True)
+        pixel_index_map = np.full(self.pixels.shape, -1, dtype=np.int32)
+        pixel_index_map[valid] = valid_index
+
+        track_pixel_map = detsim.get_track_pixel_map(pixel_index_map, unique_pix.shape[0], detsim.MAX_TRACKS_PER_PIXEL)
+
+        expected = np.full((unique_pix.shape[0], detsim.MAX_TRACKS_PER_PIXEL), -1)
+        track_pixel_map_kernel.forall(unique_pix.shape[0])(expected, unique_pix, self.pixels)
+
+        assert np.array_equal(track_pixel_map, expected)
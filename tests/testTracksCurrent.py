@@ -6,44 +6,72 @@ import pytest
 from larndsim import consts
 
 consts.load_properties("larndsim/detector_properties/module0.yaml",
-                       "larndsim/pixel_layouts/multi_tile_layout-2.3.16.yaml")
+                       "larndsim/pixel_layouts/multi_tile_layout-2.3.16.yaml",
+                       "larndsim/simulation_properties/singles_sim.yaml")
 from larndsim.consts import detector, physics
 
 from larndsim import detsim
 from larndsim import drifting, quenching, pixels_from_track
 
 from math import ceil
+from numba import config
 
 class TestTrackCurrent:
-    tracks = np.zeros((10, 26))
+    n_tracks = 2
+    rng = np.random.default_rng(0)
+    tracks = np.zeros((n_tracks, 26))
     tracks = np.core.records.fromarrays(tracks.transpose(), 
                                         names="eventID, dEdx, x_start, dE, t_start, z_end, trackID, x_end, y_end, n_electrons, n_photons, t, dx, pdgId, y, x, long_diff, z, z_start, y_start, tran_diff, t_end, pixel_plane, t0, t0_start, t0_end",
                                         formats = "i8, f8, f8, f8, f8, f8, i8, f8, f8, f8, f8, f8, f8, f8, f8, f8, f8, f8, f8, f8, f8, f8, i8, f8, f8, f8")
-    tracks["z_start"] = np.random.uniform(detector.TPC_BORDERS[0][2][0], detector.TPC_BORDERS[0][2][1], 10)
-    tracks["z_end"] = np.random.uniform(detector.TPC_BORDERS[0][2][0], detector.TPC_BORDERS[0][2][0]+2, 10)
+    # short segments, to keep the simulator fast, drifting for longer than the time padding
+    tracks["z_start"] = rng.uniform(detector.TPC_BORDERS[0][2][0]+2, detector.TPC_BORDERS[0][2][0]+2.2, n_tracks)
+    tracks["z_end"] = rng.uniform(detector.TPC_BORDERS[0][2][0]+2, detector.TPC_BORDERS[0][2][0]+2.2, n_tracks)
     tracks["z"] = (tracks["z_end"]+tracks["z_start"])/2.
-    tracks["y_start"] = np.random.uniform(detector.TPC_BORDERS[0][1][0], detector.TPC_BORDERS[0][1][0]+2, 10)
-    tracks["y_end"] = np.random.uniform(detector.TPC_BORDERS[0][1][0], detector.TPC_BORDERS[0][1][0]+2, 10)
-    tracks["x_start"] = np.random.uniform(detector.TPC_BORDERS[0][0][0], detector.TPC_BORDERS[0][0][0]+2, 10)
-    tracks["x_end"] = np.random.uniform(detector.TPC_BORDERS[0][0][0], detector.TPC_BORDERS[0][0][0]+2, 10)
+    tracks["y_start"] = rng.uniform(detector.TPC_BORDERS[0][1][0]+1, detector.TPC_BORDERS[0][1][0]+2, n_tracks)
+    tracks["y_end"] = rng.uniform(detector.TPC_BORDERS[0][1][0]+1, detector.TPC_BORDERS[0][1][0]+2, n_tracks)
+    tracks["x_start"] = rng.uniform(detector.TPC_BORDERS[0][0][0]+1, detector.TPC_BORDERS[0][0][0]+2, n_tracks)
+    tracks["x_end"] = rng.uniform(detector.TPC_BORDERS[0][0][0]+1, detector.TPC_BORDERS[0][0][0]+2, n_tracks)
     tracks["x"] = (tracks["x_end"]+tracks["x_start"])/2.
     tracks["y"] = (tracks["y_end"]+tracks["y_start"])/2.
     tracks["dx"] = np.sqrt((tracks["x_end"]-tracks["x_start"])**2+(tracks["y_end"]-tracks["y_start"])**2+(tracks["z_end"]-tracks["z_start"])**2)
-    tracks["dEdx"] = [2]*10
+    tracks["dEdx"] = [2]*n_tracks
     tracks["dE"] = tracks["dEdx"]*tracks["dx"]
-    tracks["tran_diff"] = [1e-1]*10
-    tracks["long_diff"] = [1e-1]*10
     tracks["t0"] = 0
     tracks["t0_start"] = 0
     tracks["t0_end"] = 0
 
-    def test_current_model(self):
+    @staticmethod
+    def flat_response(n_ticks):
+        """
+        Response which collects a unit charge on the pixel right below it
+        over `n_ticks` time ticks, so that the total current gives back the charge
+        """
+        # the response bins cover half a pixel, one more tick for the rounding
+        # of the time ticks at the edges of the time window
+        n_bins = round(detector.PIXEL_PITCH / 2 / detector.RESPONSE_BIN_SIZE)
+        response = np.full((n_bins, n_bins, n_ticks + 1),
+                           physics.E_CHARGE / (detector.TIME_SAMPLING * n_ticks))
+
+        return response
+
+    @pytest.mark.skipif(config.ENABLE_CUDASIM and not config.DISABLE_JIT,
+                        reason="the CUDA simulator calls the njit helpers only with NUMBA_DISABLE_JIT=1")
+    def test_current_model(self, monkeypatch):
+        # a short time window and padding, so that the whole response of
+        # the charge falls within the time ticks, and a finer sampling of the charge
+        n_ticks = 2
+        monkeypatch.setattr(detector, "TIME_WINDOW", n_ticks * detector.TIME_SAMPLING)
+        monkeypatch.setattr(detector, "TIME_PADDING", 5)
+        monkeypatch.setattr(detector, "SAMPLED_POINTS", 60)
 
         tracks = np.copy(self.tracks)
         threadsperblock = 128
         blockspergrid = ceil(tracks.shape[0] / threadsperblock)
         quenching.quench[blockspergrid,threadsperblock](tracks, physics.BOX)
         drifting.drift[blockspergrid,threadsperblock](tracks)
+        # the diffusion of a long drift, which the sampling of the charge resolves
+        tracks["tran_diff"] = 1e-1
+        tracks["long_diff"] = 1e-1
 
         MAX_PIXELS = 110
         MAX_ACTIVE_PIXELS = 50
@@ -61,16 +89,14 @@ class TestTrackCurrent:
         signals = np.zeros((tracks.shape[0],
                             neighboring_pixels.shape[1],
                             detector.TIME_TICKS.shape[0]), dtype=np.float32)
-        threadsperblock = (1,1,64)
+        threadsperblock = (1,64)
         blockspergrid_x = ceil(signals.shape[0] / threadsperblock[0])
         blockspergrid_y = ceil(signals.shape[1] / threadsperblock[1])
-        blockspergrid_z = ceil(signals.shape[2] / threadsperblock[2])
-        blockspergrid = (blockspergrid_x, blockspergrid_y, blockspergrid_z)
-        response = np.load('larndsim/bin/response_44.npy')
+        blockspergrid = (blockspergrid_x, blockspergrid_y)
+        response = self.flat_response(n_ticks)
         detsim.tracks_current[blockspergrid,threadsperblock](signals,
                                                              neighboring_pixels,
                                                              tracks,
                                                              response)
-        print(np.sum(signals) * detector.TIME_SAMPLING / physics.E_CHARGE)
-
+        assert np.any(signals != 0)
         assert np.sum(signals) * detector.TIME_SAMPLING / physics.E_CHARGE == pytest.approx(np.sum(tracks['n_electrons']), rel=0.05)
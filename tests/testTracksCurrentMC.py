@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+import numpy as np
+import pytest
+
+from larndsim import consts
+
+consts.load_properties("larndsim/detector_properties/module0.yaml",
+                       "larndsim/pixel_layouts/multi_tile_layout-2.3.16.yaml",
+                       "larndsim/simulation_properties/singles_sim.yaml")
+
+from larndsim.consts import detector
+
+from larndsim import detsim
+from larndsim.pixels_from_track import pixel2id
+
+from numba import config
+from numba.cuda.random import create_xoroshiro128p_states
+
+class TestTracksCurrentMC:
+    """
+    MC current calculation testing
+    """
+    tracks = np.zeros((2, 26))
+    tracks = np.core.records.fromarrays(tracks.transpose(),
+                                        names="eventID, dEdx, x_start, dE, t_start, z_end, trackID, x_end, y_end, n_electrons, n_photons, t, dx, pdgId, y, x, long_diff, z, z_start, y_start, tran_diff, t_end, pixel_plane, t0, t0_start, t0_end",
+                                        formats = "i8, f8, f8, f8, f8, f8, i8, f8, f8, f8, f8, f8, f8, f8, f8, f8, f8, f8, f8, f8, f8, f8, i8, f8, f8, f8")
+    # two parallel segments above the same pixels, drifting for 1 cm
+    tracks["x_start"] = detector.TPC_BORDERS[0][0][0] + 10.1 * detector.PIXEL_PITCH
+    tracks["x_end"] = tracks["x_start"] + 2 * detector.PIXEL_PITCH
+    tracks["y_start"] = detector.TPC_BORDERS[0][1][0] + np.array([10.3, 10.6]) * detector.PIXEL_PITCH
+    tracks["y_end"] = tracks["y_start"]
+    tracks["z_start"] = detector.TPC_BORDERS[0][2][0] + 1
+    tracks["z_end"] = tracks["z_start"] + 0.1
+    tracks["n_electrons"] = 1e4
+    tracks["tran_diff"] = 1e-2
+    tracks["long_diff"] = 1e-2
+    # the signal starts just before the charge reaches the anode
+    tracks["t_start"] = 1 / detector.V_DRIFT + detector.TIME_PADDING - 2
+    tracks["t_end"] = tracks["t_start"] + 1
+
+    pixels = np.array([[pixel2id(10 + ix, 10, 0) for ix in range(3)]] * 2, dtype=np.int32)
+    unique_pix, pixel_index_map = np.unique(pixels, return_inverse=True)
+    pixel_index_map = pixel_index_map.reshape(pixels.shape).astype(np.int32)
+    track_pixel_map = np.full((unique_pix.shape[0], detsim.MAX_TRACKS_PER_PIXEL), -1)
+    track_pixel_map[:, :2] = [0, 1]
+    active_pairs = np.argwhere(pixels != -1).astype(np.int32)
+
+    def run_mc(self, seed):
+        track_starts, max_length = detsim.get_time_intervals(self.tracks)
+        n_ticks = min(max_length, 40)
+
+        pixels_signals = np.zeros((self.unique_pix.shape[0], 200), dtype=np.float32)
+        pixels_tracks_signals = np.zeros((self.unique_pix.shape[0], 200, detsim.MAX_TRACKS_PER_PIXEL), dtype=np.float32)
+        response = np.load('larndsim/bin/response_44.npy')
+        rng_states = create_xoroshiro128p_states(self.active_pairs.shape[0], seed=seed)
+        detsim.tracks_current_mc.forall(self.active_pairs.shape[0])(pixels_signals,
+                                                                    pixels_tracks_signals,
+                                                                    n_ticks,
+                                                                    self.active_pairs,
+                                                                    self.pixels,
+                                                                    self.tracks,
+                                                                    response,
+                                                                    rng_states,
+                                                                    track_starts,
+                                                                    self.pixel_index_map,
+                                                                    self.track_pixel_map)
+
+        return pixels_signals, pixels_tracks_signals
+
+    @pytest.mark.skipif(config.ENABLE_CUDASIM and not config.DISABLE_JIT,
+                        reason="the CUDA simulator calls the njit helpers only with NUMBA_DISABLE_JIT=1")
+    def test_reproducibility(self, monkeypatch):
+        # fewer MC steps, to keep the simulator fast
+        monkeypatch.setattr(detsim, "MIN_STEP_SIZE", 0.05)
+
+        pixels_signals, pixels_tracks_signals = self.run_mc(seed=1)
+        assert np.any(pixels_signals != 0)
+
+        # the same random states give the same waveforms
+        pixels_signals_again, pixels_tracks_signals_again = self.run_mc(seed=1)
+        assert np.array_equal(pixels_signals, pixels_signals_again)
+        assert np.array_equal(pixels_tracks_signals, pixels_tracks_signals_again)
+
+        # while different states give a different diffusion of the charges
+        pixels_signals_other, _ = self.run_mc(seed=2)
+        assert not np.array_equal(pixels_signals, pixels_signals_other)
+
+        # the waveforms of each track add up to the pixel waveforms
+        assert np.sum(pixels_tracks_signals, axis=2) == pytest.approx(pixels_signals, abs=1e-3)
+
+    @pytest.mark.skipif(config.ENABLE_CUDASIM and not config.DISABLE_JIT,
+                        reason="the CUDA simulator calls the njit helpers only with NUMBA_DISABLE_JIT=1")
+    def test_rng_states(self, monkeypatch):
+        monkeypatch.setattr(detsim, "MIN_STEP_SIZE", 0.05)
+
+        # the signals span the whole time padding, as in the simulation
+        track_starts, max_length = detsim.get_time_intervals(self.tracks)
+        assert max_length >= detector.TIME_PADDING / detector.TIME_SAMPLING
+
+        # one state for each valid pair is enough for all the time ticks,
+        # an out-of-range state would fail in the simulator
+        n_states = self.active_pairs.shape[0]
+        rng_states = create_xoroshiro128p_states(n_states, seed=1)
+        initial_states = np.copy(rng_states["s0"])
+        pixels_signals = np.zeros((self.unique_pix.shape[0], 200), dtype=np.float32)
+        pixels_tracks_signals = np.zeros((self.unique_pix.shape[0], 200, detsim.MAX_TRACKS_PER_PIXEL), dtype=np.float32)
+        response = np.load('larndsim/bin/response_44.npy')
+        detsim.tracks_current_mc.forall(n_states)(pixels_signals,
+                                                  pixels_tracks_signals,
+                                                  max_length,
+                                                  self.active_pairs,
+                                                  self.pixels,
+                                                  self.tracks,
+                                                  response,
+                                                  rng_states,
+                                                  track_starts,
+                                                  self.pixel_index_map,
+                                                  self.track_pixel_map)
+
+        # each pair has drawn from its own state, and only from it
+        assert np.all(rng_states["s0"] != initial_states)
+        assert np.any(pixels_signals != 0)